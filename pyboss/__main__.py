@@ -1,4 +1,16 @@
+import argparse
+import sys
+
 from pyboss import bot
+from pyboss.utils import migrations
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="pyboss", description="Runs the bot")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exits with status 1 if database migrations are pending, without running",
+    )
+    if parser.parse_args().check:
+        sys.exit(migrations.check())
     bot.run()
@@ -4,7 +4,11 @@ import os
 import discord
 from discord.ext import commands
 
-from pyboss.utils import database, resolver
+from pyboss import CONFIG
+from pyboss.cogs.utils.reactions import router
+from pyboss.controllers.special import specials
+from pyboss.utils import database, metrics, migrations, resolver
+from pyboss.utils.scheduler import scheduler
 
 # Create a logger for this file, __name__ will take the package name if this file
 # will does not run as a scrip
@@ -12,6 +16,34 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv("DISCORD_TOKEN")
 
 
+class Bot(commands.Bot):
+    """
+    A commands.Bot which runs the scheduled jobs, routes the raw reactions to
+    the cogs watching them and writes its pending data in database before closing
+    """
+
+    async def start(self, *args, **kwargs):
+        if port := CONFIG["metrics"]["port"]:
+            await metrics.serve(CONFIG["metrics"]["host"], port)
+        await specials.load()
+        await scheduler.start()
+        await super().start(*args, **kwargs)
+
+    async def on_raw_reaction_add(self, payload):
+        await router.dispatch(self, payload)
+
+    async def on_raw_reaction_remove(self, payload):
+        await router.dispatch(self, payload)
+
+    async def on_guild_channel_update(self, _before, after):
+        router.forget_channel(after.id)
+
+    async def close(self):
+        scheduler.stop()
+        await database.close()
+        await super().close()
+
+
 def run(token=None) -> None:
     """
     Runs the bot.
@@ -19,10 +51,12 @@ def run(token=None) -> None:
     """
     # Try to connect to the database or raise error
     database.test_connection()
+    # Creates or upgrades the schema before any query of the cogs
+    migrations.upgrade()
 
     # Create a bot instance and activate all intents (more access to members infos)
     intents = discord.Intents.all()
-    bot = commands.Bot(command_prefix="!", intents=intents)
+    bot = Bot(command_prefix="!", intents=intents)
 
     # loads all available cogs
     for cog in resolver.find_available_cogs():
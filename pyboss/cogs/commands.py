@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from itertools import cycle
 
@@ -5,12 +6,16 @@ import discord
 from discord.ext import commands, tasks
 
 from pyboss.controllers.guild import GuildController
+from pyboss.utils.leaderboard import leaderboard
 
 from .utils import youtube
 from .utils.checkers import is_guild_owner
 
 logger = logging.getLogger(__name__)
 
+PAGE_SIZE = 10
+PAGE_EMOJIS = ("◀️", "▶️")
+
 
 class Commands(commands.Cog):
     def __init__(self, bot):
@@ -25,14 +30,14 @@ class Commands(commands.Cog):
         Change le status du bot par des vidéos correspondantes à la recherche
         """
         query = " ".join(params)
-        videos = []
-        for video in youtube.search(query, n=50):
-            videos.append(discord.Streaming(**video))
+        videos = [
+            discord.Streaming(**video) for video in await youtube.search(query, n=50)
+        ]
 
         if len(videos) > 0:
             self.status = cycle(videos)
         else:
-            ctx.send("Aucune vidéo n'a été trouvée")
+            await ctx.send("Aucune vidéo n'a été trouvée")
 
     @tasks.loop(seconds=30)
     async def loop_status(self):
@@ -68,17 +73,19 @@ class Commands(commands.Cog):
         """
         Consulter les infos d'un membre
         """
-        id = mention.strip("<>!?@&") if mention else ctx.author.id
+        id = mention.strip("<>!?@&") if mention else str(ctx.author.id)
         if not id.isdigit():
             await ctx.send(f"{mention} est incorrect")
 
-        elif member := GuildController(ctx.guild).get_member_by_id(int(id)):
+        elif member := await GuildController.of(ctx.guild).get_member_by_id(int(id)):
             embed = discord.Embed(title="Profil", colour=0xFFA325)
             embed.set_author(name=member.name)
             embed.set_thumbnail(url=member.avatar_url)
             embed.add_field(name="Name", value=member.mention, inline=True)
             embed.add_field(name="Level", value=member.level, inline=True)
             embed.add_field(name="XP", value=member.XP, inline=True)
+            if rank := await leaderboard.rank(member.id):
+                embed.add_field(name="Rang", value=f"#{rank}", inline=True)
             embed.add_field(
                 name="Membre depuis...",
                 value=f"{member.joined_at:%d/%m/%Y}",
@@ -86,6 +93,58 @@ class Commands(commands.Cog):
             )
             await ctx.send(embed=embed)
 
+    async def leaderboard_embed(self, guild, number: int, pages: int):
+        lines = []
+        for rank, id, name, xp in await leaderboard.page(number, PAGE_SIZE):
+            if member := guild.get_member(id):
+                name = member.display_name
+            lines.append(f"**#{rank}** {name} — {xp} XP")
+        embed = discord.Embed(
+            title="Classement",
+            colour=0xFFA325,
+            description="\n".join(lines) or "Aucun membre n'est classé",
+        )
+        embed.set_footer(text=f"Page {number}/{pages}")
+        return embed
+
+    @commands.command(name="leaderboard", aliases=["top"])
+    @commands.guild_only()
+    async def show_leaderboard(self, ctx, page: int = 1):
+        """
+        Affiche le classement des membres par XP
+        """
+        pages = max(1, -(-(await leaderboard.count()) // PAGE_SIZE))
+        number = min(max(1, page), pages)
+        embed = await self.leaderboard_embed(ctx.guild, number, pages)
+        msg = await ctx.send(embed=embed)
+        if pages == 1:
+            return
+
+        for emoji in PAGE_EMOJIS:
+            await msg.add_reaction(emoji)
+
+        def check(reaction, user):
+            return (
+                reaction.message.id == msg.id
+                and user == ctx.author
+                and str(reaction.emoji) in PAGE_EMOJIS
+            )
+
+        while True:
+            try:
+                reaction, user = await self.bot.wait_for(
+                    "reaction_add", check=check, timeout=60
+                )
+            except asyncio.TimeoutError:
+                break
+            step = -1 if str(reaction.emoji) == PAGE_EMOJIS[0] else 1
+            number = (number + step - 1) % pages + 1
+            await msg.edit(embed=await self.leaderboard_embed(ctx.guild, number, pages))
+            try:
+                await msg.remove_reaction(reaction.emoji, user)
+            except discord.Forbidden:
+                pass
+
     # TODO: add embed_send command and LaTeX command like Texit bot
 
 
@@ -4,6 +4,7 @@ from datetime import datetime
 import discord
 from discord.ext import commands
 
+from pyboss.controllers.guild import GuildController
 from pyboss.controllers.member import MemberController
 from pyboss.controllers.message import MessageController
 
@@ -26,14 +27,15 @@ class Events(commands.Cog):
         """
         When a member join a guild, insert it in database or restore all its data
         """
-        member_ctrl = MemberController(member)
+        GuildController.of(member.guild).add_member(member)
+        member_ctrl = await MemberController.load(member)
         if member_ctrl.exists():
             await member.add_roles(
-                member_ctrl.sub_roles | {member_ctrl.top_role},  # union
+                *(member_ctrl.sub_roles | {member_ctrl.top_role}),  # union
                 reason="The user was already register, re-attribute the main role",
             )
         else:
-            member_ctrl.register()
+            await member_ctrl.register()
             default_role = member_ctrl.get_role_by_name("Non Vérifié")
             await member.add_roles(default_role, reason="User was not verified")
 
@@ -54,33 +56,47 @@ class Events(commands.Cog):
         await publish_channel.send(embed=embed)
 
     @commands.Cog.listener()
-    async def on_message(self, ctx):
+    async def on_member_remove(self, member):
+        GuildController.of(member.guild).remove_member(member)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        """
+        Keep the member indexes up to date when a user changes his name
+        """
+        for guild in GuildController.all():
+            if guild.get_member(after.id):
+                guild.rename_member(before, after)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
         """
         Log message in database for users
         """
-        if ctx.author.id != self.bot.user.id:
-            MessageController(ctx.message).insert()
+        if message.author.id != self.bot.user.id:
+            await MessageController(message).insert()
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
         """
         Check if a member has updated roles and modifies them in the database
         """
+        GuildController.of(after.guild).rename_member(before, after)
         if before.roles == after.roles:
             return
 
-        member_ctrl = MemberController(after)
+        member_ctrl = await MemberController.load(after)
         if member_ctrl.exists():
             sub_roles = set()
             for role in after.roles:
                 if role.name in ("Prof", "Non Vérifié", "Élève G1", "Élève G2"):
-                    member_ctrl.top_role = role
+                    await member_ctrl.set_top_role(role)
                 elif role.name.startswith("Groupe"):
-                    member_ctrl.group_role = role
+                    await member_ctrl.set_group_role(role)
                 elif role.name != "@everyone":
                     sub_roles.add(role)
 
-            member_ctrl.sub_roles = sub_roles
+            await member_ctrl.set_sub_roles(sub_roles)
         else:
             logging.error(f"The user {after.name} was not found in members table")
 
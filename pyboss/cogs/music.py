@@ -1,25 +1,16 @@
-import asyncio
+import logging
 
-import discord
-import youtube_dl
 from discord.ext import commands
+from youtube_dl.utils import DownloadError
 
-from .utils import youtube
-
-ytdl = youtube_dl.YoutubeDL()
+from pyboss.utils.metrics import Gauge
 
+from .utils import youtube
+from .utils.audio_cache import audio_cache
+from .utils.player import Player, Video
+from .utils.stream import resolver, video_id
 
-class Video:
-    """
-    Represents a video with stream url and name extracted by youtube_dl
-    """
-
-    def __init__(self, name, url):
-        video = ytdl.extract_info(url, download=False)
-        video_format = video["formats"][0]
-        self.url = url
-        self.name = name
-        self.stream_url = video_format["url"]
+logger = logging.getLogger(__name__)
 
 
 class Music(commands.Cog):
@@ -29,7 +20,19 @@ class Music(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.musics = {}
+        self.players = {}  # guild id -> Player
+        Gauge(
+            "music_cache",
+            "Statistics of the audio cache on disk",
+            lambda: [({"stat": k}, v) for k, v in audio_cache.stats.items()],
+        )
+
+    def cog_unload(self):
+        audio_cache.close()
+
+    def remove_player(self, player: Player):
+        if self.players.get(player.voice_client.guild.id) is player:
+            del self.players[player.voice_client.guild.id]
 
     @commands.command(name="play", aliases=["p"])
     @commands.guild_only()
@@ -39,67 +42,43 @@ class Music(commands.Cog):
         """
         voice_client = ctx.guild.voice_client
         query = " ".join(params)
-        try:
-            v_infos = next(youtube.search(query, n=1))
-        except StopIteration:
+        if not (videos := await youtube.search(query, n=1)):
             await ctx.send("Aucune musique n'a été trouvée.")
             return
+        video = Video(**videos[0])
+
+        try:
+            # Checks that the video can be played, the stream stays in cache
+            if video_id(video.url) not in audio_cache:
+                await resolver.resolve(video.url)
+        except DownloadError as err:
+            logger.error(f"The stream of {video.url} can't be extracted: {err}")
+            await ctx.send("Cette musique ne peut pas être lue.")
+            return
 
-        if voice_client and voice_client.channel:
+        if voice_client and (player := self.players.get(ctx.guild.id)):
             # if client is already connected
-            video = Video(**v_infos)
-            self.musics[ctx.guild].append(video)
+            player.add(video)
             await ctx.send(f"Musique ajoutée à la file d'attente: **{video.name}**")
         elif ctx.author.voice:
-            voice_channel = ctx.author.voice.channel
-            video = Video(**v_infos)
-            self.musics[ctx.guild] = []
-            voice_client = await voice_channel.connect()
-            self.play_song(voice_client, self.musics[ctx.guild], video)
+            voice_client = await ctx.author.voice.channel.connect()
+            player = Player(voice_client, on_finish=self.remove_player)
+            self.players[ctx.guild.id] = player
+            player.add(video)
 
             await ctx.send(f"Musique en cours: **{video.name}** \n{video.url}")
         else:
             await ctx.send("Vous n'êtes pas connecté à un salon vocal")
 
-    def play_song(self, voice_client, queue, song):
-        """
-        Couroutine to play a song
-        """
-        source = discord.PCMVolumeTransformer(
-            discord.FFmpegPCMAudio(
-                song.stream_url,
-                before_options="-reconnect 1 -reconnect_streamed 1",
-            )
-        )
-
-        def next_song(_):
-            if len(queue) > 0:
-                new_song = queue.pop(0)
-                self.play_song(voice_client, queue, new_song)
-            else:
-                try:
-                    asyncio.run_coroutine_threadsafe(
-                        voice_client.disconnect, self.bot.loop
-                    )
-                except TypeError:
-                    pass
-
-        voice_client.play(source, after=next_song)
-
     @commands.command()
     @commands.guild_only()
     async def skip(self, ctx):
         """
         Passer à la musique suivante, si disponible
         """
-        voice_client = ctx.guild.voice_client
-        try:
-            voice_client.stop()
-        except TypeError:
-            pass
-        else:
-            video = self.musics[ctx.guild][0]
-            await ctx.send(f"Morceau en cours: **{video.name}** \n{video.url}")
+        if player := self.players.get(ctx.guild.id):
+            if video := player.skip():
+                await ctx.send(f"Morceau en cours: **{video.name}** \n{video.url}")
 
     @commands.command()
     @commands.guild_only()
@@ -115,15 +94,43 @@ class Music(commands.Cog):
         if voice_client.is_paused():
             voice_client.resume()
 
+    @commands.command(aliases=["vol"])
+    @commands.guild_only()
+    async def volume(self, ctx, percent: int):
+        """
+        Change le volume de la musique, de 0 à 200%
+        """
+        if not (player := self.players.get(ctx.guild.id)):
+            await ctx.send("Aucune musique n'est en cours")
+        elif not 0 <= percent <= 200:
+            await ctx.send("Le volume doit être compris entre 0 et 200%")
+        elif player.set_volume(percent / 100):
+            await ctx.send(f"Volume: {percent}%")
+        else:
+            await ctx.send(f"Volume: {percent}%, à partir du prochain morceau")
+
+    @commands.command(name="music_cache", hidden=True)
+    @commands.is_owner()
+    async def cache_stats(self, ctx):
+        """
+        Affiche les statistiques du cache des musiques
+        """
+        if not audio_cache.enabled:
+            await ctx.send("Le cache des musiques est désactivé")
+        else:
+            stats = audio_cache.stats
+            await ctx.send(", ".join(f"{key}: {value}" for key, value in stats.items()))
+
     @commands.command(aliases=["quit"])
     @commands.guild_only()
     async def leave(self, ctx):
         """
         Arrêter la musique et la queue
         """
-        voice_client = ctx.guild.voice_client
-        await voice_client.disconnect()
-        self.musics[ctx.guild] = []
+        if player := self.players.get(ctx.guild.id):
+            await player.stop()
+        elif voice_client := ctx.guild.voice_client:
+            await voice_client.disconnect()
 
 
 def setup(bot):
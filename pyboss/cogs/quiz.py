@@ -1,19 +1,27 @@
 import asyncio
-import itertools
 import logging
 import math
 import random
 import string
+import time
 
 import discord
 from discord.ext import commands
-from emoji import emojize
 from sqlalchemy import insert
 
+from pyboss import CONFIG
 from pyboss.controllers.guild import GuildController
 from pyboss.controllers.member import MemberController
 from pyboss.models import Quiz
 from pyboss.utils import database
+from pyboss.utils.ledger import ledger
+from pyboss.utils.metrics import Gauge
+from pyboss.utils.scheduler import scheduler
+
+from .utils.quiz import bank, letter_emoji
+from .utils.reactions import ADD, BOTH, router
+
+logger = logging.getLogger(__name__)
 
 
 def quiz_channel(ctx):
@@ -40,67 +48,116 @@ class Question:
         "Avez vous vu l'heure !? Temps terminé !",
     ]
 
-    def __init__(self, bot, channel: discord.TextChannel, question: dict):
+    def __init__(self, bot, channel: discord.TextChannel, quiz: Quiz):
         self.bot = bot
         self.channel = channel
-        self.guild = GuildController(channel.guild)
-        self.question_dict = question
-        self.player_wins = set()
-        self.player_loses = set()
+        self.guild = GuildController.of(channel.guild)
+        self.quiz = quiz
         self.message = None
+        # Latest choice of each player, ordered from the oldest answer
+        self.answers: dict[int, str] = {}
+        self.correct_emoji = letter_emoji(quiz.answer) if quiz.answer else None
+        self.emojis = [
+            # line is of the form "A) This is a proposition"
+            letter_emoji(line[0])
+            for line in quiz.propositions.split("\n")
+            if line
+        ]
+
+    @property
+    def player_wins(self) -> list[int]:
+        return [id for id, emoji in self.answers.items() if emoji == self.correct_emoji]
 
-    async def send_question(self, timeout=30.0):
+    @property
+    def player_loses(self) -> list[int]:
+        return [id for id, emoji in self.answers.items() if emoji != self.correct_emoji]
+
+    def record(self, player_id: int, emoji: str):
+        """
+        Records the choice of a player and returns his previous one,
+        which must be removed from the message, if any
+        """
+        if emoji not in self.emojis:
+            return None
+        previous = self.answers.pop(player_id, None)
+        self.answers[player_id] = emoji  # Moved at the end, as the latest answer
+        return previous if previous != emoji else None
+
+    def forget(self, player_id: int, emoji: str):
+        """
+        Forgets the choice of a player when he removes his reaction
+        """
+        if self.answers.get(player_id) == emoji:
+            del self.answers[player_id]
+
+    async def send_question(self):
         """
         Send a question in Quiz channel
 
-        Question is a dict fetched from the quiz table that's contains field:
-        author - them - name - question - propositions - response
+        Question is a row fetched from the quiz table that's contains field:
+        author - theme - question - propositions - answer
         """
         embed = discord.Embed(
-            title=self.question_dict["question"],
+            title=self.quiz.question,
             colour=random.choice(self.COLOURS),
-            description=self.question_dict["propositions"],
+            description=self.quiz.propositions,
         )
-        embed.set_author(name=self.question_dict["theme"])
-        embed.set_footer(text=f"Auteur: {self.question_dict['author']}")
+        embed.set_author(name=self.quiz.theme)
+        embed.set_footer(text=f"Auteur: {self.quiz.author}")
         self.message = await self.channel.send(embed=embed)
 
-        for line in self.question_dict["propositions"].split("\n"):
-            # line is of the form "A) This is a proposition"
-            if line:
-                # Get emoji from it name that's depends on the first letter
-                char = line[0].lower()
-                emoji = emojize(f":regional_indicator:{char}", use_aliases=True)
-                await self.message.add_reaction(emoji)
-
-        await asyncio.sleep(timeout)
+    async def add_propositions(self):
+        for emoji in self.emojis:
+            await self.message.add_reaction(emoji)
 
     async def send_rank(self):
         """
-        Check reactions, send a rank info and ajust XP of the members
+        Check answers, ajust XP of the members in one transaction
+        and send a rank info with their new level
         """
 
         def win_score(n, coef, level):
+            level = max(level, 1)
             return math.ceil(((200 + level) * math.sqrt(n)) / (math.sqrt(coef) * level))
 
         def lose_score(level):
             return math.ceil(20 * math.sqrt(level))
 
-        description = "**Gagnants**: \n" if self.player_wins else ""
-        nb_players = len(self.player_wins) + len(self.player_loses)
-
-        for id, i in zip(self.player_wins, itertools.count(1)):
-            mod_member = self.guild.get_member(id)
-            score = win_score(nb_players, i, mod_member.level)
-            description += f"{i}. {mod_member.name}: +{score}XP \n"
-            mod_member.XP += score
+        wins, loses = self.player_wins, self.player_loses
+        nb_players = len(wins) + len(loses)
+        members = {}
+        for id in wins + loses:
+            mod_member = await self.guild.get_member_by_id(id)
+            if mod_member and mod_member.exists():
+                members[id] = mod_member
+        wins = [id for id in wins if id in members]
+        loses = [id for id in loses if id in members]
+
+        # All scores are computed before being written at once
+        deltas = {}
+        for i, id in enumerate(wins, 1):
+            deltas[id] = win_score(nb_players, i, members[id].level)
+        for id in loses:
+            deltas[id] = -lose_score(nb_players)
+        settled = await ledger.settle(deltas)
+
+        def level_of(id):
+            _, level = settled.get(id, (None, members[id].level))
+            return level
+
+        description = "**Gagnants**: \n" if wins else ""
+        for i, id in enumerate(wins, 1):
+            description += (
+                f"{i}. {members[id].name}: +{deltas[id]}XP "
+                f"(niveau {level_of(id)}) \n"
+            )
 
-        description += "\n**Perdants**: \n" if self.player_loses else ""
-        for id in self.player_loses:
-            mod_member = self.guild.get_member(id)
-            score = lose_score(nb_players)
-            description += f":small_red_triangle_down: {mod_member.name}: -{score}XP \n"
-            mod_member.XP -= score
+        description += "\n**Perdants**: \n" if loses else ""
+        for id in loses:
+            description += (
+                f":small_red_triangle_down: {members[id].name}: {deltas[id]}XP "
+                f"(niveau {level_of(id)}) \n"
+            )
 
         embed = discord.Embed(
             title=":hourglass: Résultats de la question:",
@@ -110,7 +167,158 @@ class Question:
         embed.set_footer(text=random.choice(self.TIMEOUT_MESSAGES))
         await self.channel.send(embed=embed)
 
-        return self.player_wins, self.player_loses
+        return wins, loses
+
+
+class QuizSession:
+    """
+    A party of questions in a channel, with its own scores.
+    Each step is run by a timer of the shared scheduler, a question is closed
+    before its timeout once the players of the party have answered
+    """
+
+    def __init__(
+        self, manager, bot, channel, quizzes, *, timeout, pause, quorum=1.0, grace=0.0
+    ):
+        self.manager = manager
+        self.bot = bot
+        self.channel = channel
+        self.timeout = timeout
+        self.pause = pause
+        self.quorum = quorum
+        self.grace = grace
+        self.scores = {}
+        self.participants = set()  # Players who have answered a previous question
+        self.question = None
+        self._quizzes = list(quizzes)
+        self._nb_questions = len(self._quizzes)
+        self._timer = None
+
+    async def start(self):
+        await self._step(self._ask_next)
+
+    async def _step(self, coro_func):
+        # A failing step ends the party instead of leaving the channel locked
+        try:
+            await coro_func()
+        except Exception:
+            logger.exception(f"The quiz party in {self.channel} has failed")
+            self.stop()
+
+    async def _ask_next(self):
+        if not self._quizzes:
+            await self._finish()
+            return
+        self.question = Question(self.bot, self.channel, self._quizzes.pop(0))
+        await self.question.send_question()
+        # Registered before adding reactions, no answer can be missed
+        self.manager.watch(self.question)
+        self._timer = scheduler.call_later(
+            self.timeout, self._step, self._close_question
+        )
+        await self.question.add_propositions()
+
+    def on_answer(self):
+        """
+        Closes the question now if all participants have answered,
+        or after the grace period once a quorum of them has answered
+        """
+        if self.question is None or not self.participants:
+            return  # The first question always waits for its timeout
+        answered = self.participants & self.question.answers.keys()
+        if len(answered) == len(self.participants):
+            self._close_before(time.time())
+        elif len(answered) >= self.quorum * len(self.participants):
+            self._close_before(time.time() + self.grace)
+
+    def _close_before(self, deadline: float):
+        if deadline < self._timer.when:
+            self._timer.cancel()
+            self._timer = scheduler.call_at(deadline, self._step, self._close_question)
+
+    async def _close_question(self):
+        question, self.question = self.question, None
+        self.manager.unwatch(question.message.id)
+        self.participants |= question.answers.keys()
+        wins, _ = await question.send_rank()
+
+        for id in wins:
+            if member := self.channel.guild.get_member(id):
+                self.scores[member.name] = self.scores.get(member.name, 0) + 1
+
+        if self._quizzes:
+            self._timer = scheduler.call_later(self.pause, self._step, self._ask_next)
+        else:
+            await self._finish()
+
+    async def _finish(self):
+        if self._nb_questions > 1:
+            await self.send_rank()
+        self.stop()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.question is not None and self.question.message is not None:
+            self.manager.unwatch(self.question.message.id)
+        self.manager.remove(self)
+
+    async def send_rank(self):
+        titre, description = "Classements du Quiz:", ""
+        association = sorted(self.scores.items(), key=lambda c: c[1], reverse=True)
+        medals = [":first_place:", ":second_place:", ":third_place:"]
+
+        for rang, (player, score) in enumerate(association):
+            rang = medals[rang] if rang < 3 else rang + 1
+            description += f"{rang}  {player} : {score} points \n"
+
+        await self.channel.send(
+            embed=discord.Embed(title=titre, colour=0x00FF00, description=description)
+        )
+
+
+class SessionManager:
+    """
+    Runs one quiz party per channel, all channels can play at the same time
+    """
+
+    def __init__(self, on_reaction=None):
+        self.sessions: dict[int, QuizSession] = {}  # channel id -> party
+        self.questions: dict[int, Question] = {}  # message id -> active question
+        self.on_reaction = on_reaction  # Reaction handler of the active questions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, channel_id: int):
+        return self.sessions.get(channel_id)
+
+    def watch(self, question: Question):
+        self.questions[question.message.id] = question
+        if self.on_reaction is not None:
+            router.watch_message(question.message.id, self.on_reaction, events=BOTH)
+
+    def unwatch(self, message_id: int):
+        self.questions.pop(message_id, None)
+        router.unwatch_message(message_id)
+
+    async def start(self, bot, channel, quizzes, **options):
+        """
+        Starts a party in the channel, returns None if one is already running
+        """
+        if channel.id in self.sessions:
+            return None
+        session = self.sessions[channel.id] = QuizSession(
+            self, bot, channel, quizzes, **options
+        )
+        logger.info(f"Quiz party started in {channel}, {len(self)} active")
+        await session.start()
+        return session
+
+    def remove(self, session: QuizSession):
+        if self.sessions.get(session.channel.id) is session:
+            del self.sessions[session.channel.id]
+            logger.info(f"Quiz party ended in {session.channel}, {len(self)} active")
 
 
 class QuizCog(commands.Cog):
@@ -120,20 +328,22 @@ class QuizCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.party_active = False
-        self.active_questions = []
-        self.scores = {}
+        self.sessions = SessionManager(on_reaction=self.reaction_on_question)
+        Gauge(
+            "quiz_sessions_active", "Quiz parties running", lambda: len(self.sessions)
+        )
+
+    def cog_unload(self):
+        for session in tuple(self.sessions.sessions.values()):
+            session.stop()
 
     @commands.Cog.listener()
     @commands.guild_only()
     async def on_message(self, msg):
         """Obtain a few XP per message"""
         if msg.author.id != self.bot.user.id and not msg.content.startswith("!"):
-            try:
-                mod_member = MemberController(msg.author)
-                mod_member.XP += 25
-            except AttributeError:
-                pass
+            # Settled later by the ledger, ignored if the member is not registered
+            ledger.add(msg.author.id, 25)
 
     @commands.command(name="question", aliases=["q"])
     @commands.guild_only()
@@ -142,50 +352,7 @@ class QuizCog(commands.Cog):
         """
         Générer une question de quiz aléatoire
         """
-        sql = "SELECT * FROM quiz ORDER BY RAND () LIMIT 1"
-        question_dict = database.execute(sql)
-        question = Question(self.bot, ctx.channel, question_dict)
-        self.active_questions.append(question)
-        await question.send_question(timeout=30.0)
-        self.active_questions.remove(question)
-        await question.send_rank()
-
-    @commands.Cog.listener("on_reaction_add")
-    @commands.guild_only()
-    async def _reaction_on_question(self, reaction, player):
-        """
-        Remove ex reactions of the user in a quiz question
-        """
-
-        def get_question_if_active(question):
-            for q in self.active_questions:
-                if question.id == q.message.id:
-                    return q
-            return None
-
-        msg = reaction.message
-        question_class = get_question_if_active(msg)
-        if player == self.bot.user or not question_class or reaction.count <= 1:
-            return
-
-        char = question_class.question_dict["response"].lower()
-        correct_reaction = emojize(f"regional_indicator_{char}", use_aliases=True)
-
-        for react in msg.reactions:
-            async for user in react.users():
-                if user == player and react is reaction:
-                    wins, loses = (
-                        question_class.player_wins,
-                        question_class.player_loses,
-                    )
-                    if react.emoji == correct_reaction:
-                        wins.add(user.id)
-                        loses.remove(user.id)
-                    else:
-                        loses.add(user.id)
-                        wins.remove(user.id)
-                elif user.id != self.bot.user.id:
-                    await react.remove(user)
+        await self.start_party(ctx, 1, CONFIG["quiz"]["question_timeout"])
 
     @commands.command(name="quiz")
     @commands.guild_only()
@@ -194,27 +361,47 @@ class QuizCog(commands.Cog):
         """
         Lancer une partie de n question
         """
-        if self.party_active:
+        await self.start_party(ctx, int(nb_questions), CONFIG["quiz"]["party_timeout"])
+
+    async def start_party(self, ctx, nb_questions, timeout):
+        if self.sessions.get(ctx.channel.id):
+            await ctx.send("Une partie est déjà en cours dans ce salon")
+            return
+        quizzes = await bank.draw(ctx.channel.id, nb_questions)
+        if not quizzes:
+            await ctx.send("Aucune question n'est disponible")
+            return
+        await self.sessions.start(
+            self.bot,
+            ctx.channel,
+            quizzes,
+            timeout=timeout,
+            pause=CONFIG["quiz"]["pause"],
+            quorum=CONFIG["quiz"]["quorum"],
+            grace=CONFIG["quiz"]["grace"],
+        )
+
+    async def reaction_on_question(self, payload):
+        """
+        Records the answer of a player and removes his previous reaction
+        """
+        question = self.sessions.questions.get(payload.message_id)
+        if question is None or payload.user_id == self.bot.user.id:
+            return
+        if payload.event_type != ADD:
+            question.forget(payload.user_id, str(payload.emoji))
             return
-        self.party_active, self.scores = True, {}
-        sql = f"SELECT * FROM quiz ORDER BY RAND() LIMIT {nb_questions}"
-        questions_dict = database.execute(sql)
-
-        for question_dict in questions_dict:
-            question = Question(self.bot, ctx.channel, question_dict)
-            await question.send_question(timeout=30.0)
-            self.active_questions.append(question)
-            await asyncio.sleep(30.0)
-            self.active_questions.remove(question)
-            wins, _ = await question.send_rank()
-
-            for id in wins:
-                mod_member = GuildController(ctx.guild).get_member(id)
-                self.scores[mod_member.name] = self.scores.get(mod_member.name, 0) + 1
-            await asyncio.sleep(30.0)
-
-        await self.get_rank(ctx)
-        self.party_active = False
+
+        superseded = question.record(payload.user_id, str(payload.emoji))
+        if session := self.sessions.get(payload.channel_id):
+            session.on_answer()
+        if superseded:
+            try:
+                await question.message.remove_reaction(
+                    superseded, discord.Object(id=payload.user_id)
+                )
+            except discord.HTTPException:
+                logger.warning(f"Can't remove the reaction of {payload.user_id}")
 
     @commands.command(name="rank")
     @commands.guild_only()
@@ -223,19 +410,16 @@ class QuizCog(commands.Cog):
         """
         Affiche le classement de la partie en cours
         """
-        if not self.party_active:
-            return
-        titre, description = "Classements du Quiz:", ""
-        association = sorted(self.scores.items(), key=lambda c: c[1], reverse=True)
-        medals = [":first_place:", ":second_place:", ":third_place:"]
-
-        for rang, (player, score) in enumerate(association):
-            rang = medals[rang] if rang < 3 else rang + 1
-            description += f"{rang}  {player} : {score} points \n"
+        if session := self.sessions.get(ctx.channel.id):
+            await session.send_rank()
 
-        await ctx.send(
-            embed=discord.Embed(title=titre, colour=0x00FF00, description=description)
-        )
+    @commands.command(name="quiz_sessions", hidden=True)
+    @commands.is_owner()
+    async def active_sessions(self, ctx):
+        """
+        Affiche le nombre de parties en cours
+        """
+        await ctx.send(f"{len(self.sessions)} partie(s) de quiz en cours")
 
     @commands.command(name="question_add", aliases=["q_add"])
     @commands.check(quiz_channel)
@@ -279,11 +463,11 @@ class QuizCog(commands.Cog):
                 propositions[i] = f"{letter}) {p}"
 
             if not response:
-                logging.error(
+                logger.error(
                     f"The question {question} hasn't response or propositions"
                 )
             propositions = "\n".join(propositions)
-            database.execute(
+            result = await database.execute(
                 insert(Quiz).values(
                     author=ctx.author.name,
                     theme=theme,
@@ -292,8 +476,11 @@ class QuizCog(commands.Cog):
                     answer=response,
                 )
             )
-            mod_member = MemberController(ctx.author)
-            mod_member.XP += 500
+            if result is not None:
+                bank.add(result.inserted_primary_key[0])
+            mod_member = await MemberController.load(ctx.author)
+            if mod_member.exists():
+                mod_member.add_xp(500)
             embed = discord.Embed(
                 title="Merci!",
                 colour=0x5A546C,
@@ -5,12 +5,12 @@ from datetime import datetime
 
 import discord
 from discord.ext import commands
-from sqlalchemy import select, update
 
 from pyboss import STATIC_DIR
 from pyboss.controllers.guild import GuildController
-from pyboss.models import Special
-from pyboss.utils import database
+from pyboss.controllers.special import specials
+
+from .utils.reactions import BOTH, router
 
 
 class Roles(commands.Cog):
@@ -31,6 +31,12 @@ class Roles(commands.Cog):
         with open(STATIC_DIR / "json/reacts_pairs.json", encoding="utf-8") as f:
             self.reacts_pairs = json.load(f)
 
+        router.watch_special("guild_choice", self.reaction_guild_choice)
+        router.watch_channels("dm", self.reaction_sub_role_add, events=BOTH)
+
+    def cog_unload(self):
+        router.unwatch_all(self)
+
     async def send_choice(self, ctx, name):
         """
         Generate a welcome message to choice roles to manage permissions
@@ -58,26 +64,22 @@ class Roles(commands.Cog):
         """
         await ctx.message.delete()
         message = await self.send_choice(ctx, "guild_choice")
-        stmt = update(Special).where(name="guild_choice").values(message_id=message.id)
-        database.execute(stmt)
+        await specials.set("guild_choice", message.id)
 
-    @commands.Cog.listener("on_raw_reaction_add")
-    @commands.guild_only()
     async def reaction_guild_choice(self, payload):
         """
         Update top role or send a DM message to the user to choice his sub roles
         """
-        stmt = select(Special).where(name="guild_choice")
-        choice_msg_id = database.execute(stmt).message_id
-        if choice_msg_id != payload.message_id or self.bot.user.id == payload.user_id:
-            return  # exit if it's not for the guild_choice message
+        if self.bot.user.id == payload.user_id:
+            return
 
-        guild = GuildController(payload.guild)
-        member = guild.get_member(payload.member)
+        guild = GuildController.of(self.bot.get_guild(payload.guild_id))
+        member = await guild.get_member_by_id(payload.user_id)
         try:
             role_name = self.reacts_pairs["guild_choice"][payload.emoji.name]
             await member.remove_roles(member.top_role)
             await member.add_roles(member.get_role_by_name(role_name))
+            await member.set_top_role(role_name)
         except KeyError:
             await member.dm_channel.send(
                 f"{member.mention} Cette réaction est invalide"
@@ -87,17 +89,13 @@ class Roles(commands.Cog):
         else:
             fieldname = self.FIELDNAMES.get(member.top_role.name)
             message = await self.send_choice(member, fieldname)
-            member.choice_msg_id = message.id
+            await member.set_dm_choice_msg_id(message.id)
 
-    @commands.Cog.listener("on_raw_reaction_add")
-    @commands.Cog.listener("on_raw_reaction_remove")
-    @commands.dm_only()
     async def reaction_sub_role_add(self, payload):
         """
         React when a member choice his roles  in DM channel
         """
-        guild = GuildController(payload.guild)
-        mod_member = guild.get_member(payload.user_id)
+        mod_member = await self.find_member(payload.user_id)
 
         if mod_member and payload.message_id == mod_member.dm_choice_msg_id:
             if mod_member.validate_state == 2:
@@ -118,13 +116,22 @@ class Roles(commands.Cog):
 
         role = mod_member.get_role_by_name(emoji_value)
         if payload.event_type == "REACTION_ADD":
-            mod_member.sub_roles.add(role)
+            await mod_member.set_sub_roles(mod_member.sub_roles | {role})
         else:
-            mod_member.sub_roles.remove(role)
+            await mod_member.set_sub_roles(mod_member.sub_roles - {role})
 
         if mod_member.validate_state == 0:
             await self.send_sub_roles_validate(mod_member)
 
+    async def find_member(self, user_id):
+        """
+        Returns the member of the first guild shared with the user, for DM events
+        """
+        for guild in self.bot.guilds:
+            if member := await GuildController.of(guild).get_member_by_id(user_id):
+                return member
+        return None
+
     async def send_sub_roles_validate(self, mod_member):
         """
         Update sub roles list in json file
@@ -138,7 +145,7 @@ class Roles(commands.Cog):
         message = await mod_member.send(embed=embed)
         await message.add_reaction("✅")
         await message.add_reaction("❌")
-        mod_member.update_db(validate_state=1)
+        await mod_member.update(validate_state=1)
 
         def check(react, usr):
             if react.message.id == message.id and mod_member.id == usr.id:
@@ -151,22 +158,22 @@ class Roles(commands.Cog):
             )
         except asyncio.TimeoutError:
             await mod_member.send("Le délai de confirmaton a expiré")
-            mod_member.update_db(validate_state=0)
+            await mod_member.update(validate_state=0)
         else:
             if str(reaction.emoji) == "✅":
                 await mod_member.add_roles(
-                    mod_member.sub_roles, reason="The member has selected this matter"
+                    *mod_member.sub_roles, reason="The member has selected this matter"
                 )
                 embed = discord.Embed(
-                    title=f"Vous êtes 'fin prêt, cher {mod_member.main_role}!",
+                    title=f"Vous êtes 'fin prêt, cher {mod_member.top_role}!",
                     colour=0xFF22FF,
                     description="Vos choix ont été pris en compte, vous devez avoir à"
                     "présent accès aux salons!",
                 )
                 await mod_member.send(embed=embed)
-                mod_member.update_db(validate_state=2)
+                await mod_member.update(validate_state=2)
             else:
-                mod_member.update_db(validate_state=0)
+                await mod_member.update(validate_state=0)
                 await mod_member.send("Vos choix ont été déclinés.")
         finally:
             await message.delete()
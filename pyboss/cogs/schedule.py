@@ -1,13 +1,16 @@
 import asyncio
 import datetime
 import json
+from functools import partial
 
 import discord
 from discord.ext import commands
-from sqlalchemy import delete, insert, select, update
+from sqlalchemy import delete, insert, select
 
 from pyboss import STATIC_DIR
-from pyboss.models import Agenda, Planning, Special
+from pyboss.controllers.member import MemberController
+from pyboss.controllers.special import specials
+from pyboss.models import Agenda, Planning
 from pyboss.utils import database
 
 from .utils.checkers import is_guild_owner, is_schedule_channel
@@ -25,12 +28,8 @@ async def update_message_ref(fieldname, message: discord.Message):
     """
     Update id of agenda or planning message in database
     """
-    ex_message_id = database.execute(
-        select(Special).where(Special.name == fieldname)
-    ).scalar_one
-    database.execute(
-        update(Special).values(message_id=message.id, name=fieldname)
-    )
+    if (ex_message_id := await specials.set(fieldname, message.id)) is None:
+        return
     try:
         ex_message = await message.channel.fetch_message(ex_message_id)
     except (discord.NotFound, discord.HTTPException):
@@ -50,11 +49,15 @@ class Schedule:
         self.custom_response = ""
         self.table = self.CHANNELS_TABLES[str(ctx.channel.id)]["table"]
         self.table_class = self.CHANNELS_TABLES[str(ctx.channel.id)]["class"]
-        self.answers = {"class": self.table_class}
+        self.answers = {"class_name": self.table_class}
         self.traces = []
+        self.member_ctrl = None
+        self.blacklist_author = False
 
     async def new_procedure(self, ctx):
         await ctx.message.delete()
+        # Loaded before the checks, they are called synchronously by wait_for
+        self.member_ctrl = await MemberController.load(ctx.author)
         try:
             if self.table == "planning":
                 await self.gen_question(
@@ -92,9 +95,11 @@ class Schedule:
             )
         else:
             model = Agenda if self.table == 'agenda' else Planning
-            database.execute(
+            await database.execute(
                 insert(model).values(**self.answers)
             )
+            if self.blacklist_author:
+                await self.member_ctrl.place_in_blacklist()
             await self.update_data()
         finally:
             for msg in self.traces:
@@ -105,17 +110,22 @@ class Schedule:
 
     async def remove_procedure(self, ctx):
         await ctx.message.delete()
+        self.member_ctrl = await MemberController.load(ctx.author)
 
         try:
             msg1 = await ctx.channel.send("Quelle matière voulez-vous supprimer?")
             self.traces.append(msg1)
-            resp1 = await self.bot.wait_for("message", timeout=60, check=check_matter)
+            resp1 = await self.bot.wait_for(
+                "message", timeout=60, check=partial(check_matter, self)
+            )
             await msg1.delete()
             await resp1.delete()
 
             msg2 = await ctx.channel.send("De quel jour? (Ex: JJ/MM)")
             self.traces.append(msg2)
-            resp2 = await self.bot.wait_for("message", timeout=120, check=check_date)
+            resp2 = await self.bot.wait_for(
+                "message", timeout=120, check=partial(check_date, self)
+            )
             await msg2.delete()
             await resp2.delete()
 
@@ -126,10 +136,11 @@ class Schedule:
             )
         else:
             model = Agenda if self.table == 'agenda' else Planning
-            database.execute(
-                delete(model)
-                    .where(model.matter == self.answers["matter"],
-                           model.date == self.answers["date"])
+            await database.execute(
+                delete(model).where(
+                    model.subject == self.answers["subject"],
+                    model.date == self.answers["date"],
+                )
             )
             await self.update_data()
         finally:
@@ -142,7 +153,9 @@ class Schedule:
     async def gen_question(self, question, check=None, timeout=60):
         msg_question = await self.channel.send(question)
         self.traces.append(msg_question)
-        message = await self.bot.wait_for("message", timeout=timeout, check=check)
+        message = await self.bot.wait_for(
+            "message", timeout=timeout, check=partial(check, self)
+        )
         self.traces.append(message)
         await message.delete()
         await msg_question.delete()
@@ -152,14 +165,16 @@ class Schedule:
         Fetch the database to get the list of rows ordered by date
         """
         model = Agenda if self.table == 'agenda' else Planning
-        result = database.execute(
-            select(model).where(model.class_name == self.table_class,
-                                model.date >= datetime.datetime.now())
-        ).scalar_one
+        result = await database.fetch(
+            select(model)
+            .where(model.class_name == self.table_class,
+                   model.date >= datetime.date.today())
+            .order_by(model.date)
+        )
 
         next_date, message = None, ""
         for row in result:
-            date = row["date"]
+            date = row.date
 
             if date != next_date:
                 next_date = date
@@ -168,15 +183,15 @@ class Schedule:
                 message += f"\n__Pour le **{day}** {date:%d} {month}:__\n"
 
             description = (
-                f"*({row['description']})*" if bool(row["description"]) else ""
+                f"*({row.description})*" if bool(row.description) else ""
             )
             if self.table == "planning":
-                message += f"- \t {row['matter']}: "
+                message += f"- \t {row.subject}: "
                 message += (
-                    f"**{row['starthour']}**-**{row['endhour']}** {description}\n"
+                    f"**{row.starthour}h**-**{row.endhour}h** {description}\n"
                 )
             else:
-                message += f"\n**{row['matter']}**: {row['description']}\n"
+                message += f"\n**{row.subject}**: {row.description}\n"
 
         title = "Cours à venir:" if self.table == "planning" else "Devoirs à faire:"
         embed = discord.Embed(color=0x22CCFF, title=title, description=message)
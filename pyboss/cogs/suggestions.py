@@ -1,12 +1,23 @@
+import logging
 from datetime import datetime
+from textwrap import shorten
+from typing import Optional
 
 import discord
 from discord.ext import commands
-from sqlalchemy import insert
+from sqlalchemy import case, delete, func, insert, select, update
 
-from pyboss import STATIC_DIR
-from pyboss.models import Suggestion
+from pyboss import CONFIG, STATIC_DIR
+from pyboss.models import Suggestion, SuggestionVote
 from pyboss.utils import database
+from pyboss.utils.fanout import RateLimiter, fan_out
+
+from .utils.reactions import ADD, REMOVE, router
+from .utils.suggestions import duplicates
+
+logger = logging.getLogger(__name__)
+
+VOTE_EMOJIS = ("✅", "❌")
 
 
 def suggestion_channel(ctx):
@@ -22,6 +33,19 @@ class SuggestionCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        # Shared by all the decisions, Discord limits the DMs of the whole bot
+        self.dm_limiter = RateLimiter(
+            CONFIG["fanout"]["dm"]["rate"], CONFIG["fanout"]["dm"]["burst"]
+        )
+        self.open_suggestions = None  # Message ids, loaded at the first use
+
+        router.add_channel_class("suggestion", lambda c: "suggestion" in c.name)
+        router.watch_channels("suggestion", self.decisive_reaction, events=(ADD,))
+        router.watch_channels("suggestion", self.add_vote, events=(ADD,))
+        router.watch_channels("suggestion", self.remove_vote, events=(REMOVE,))
+
+    def cog_unload(self):
+        router.unwatch_all(self)
 
     @commands.command(name="suggestions_rules", hidden=True)
     @commands.is_owner()
@@ -42,49 +66,232 @@ class SuggestionCog(commands.Cog):
         )
         await ctx.send(embed=embed)
 
+    async def load_open_suggestions(self) -> Optional[set[int]]:
+        """
+        Returns the message ids of the open suggestions, None if they can't be
+        loaded. A failed load isn't kept, the next call tries again
+        """
+        if self.open_suggestions is None:
+            result = await database.execute(
+                select(Suggestion.message_id).where(Suggestion.state == "open")
+            )
+            if result is not None:
+                self.open_suggestions = set(result.scalars())
+        return self.open_suggestions
+
     @commands.Cog.listener("on_message")
     async def make_suggestion(self, message):
-        if suggestion_channel(message):
-            await message.add_reaction("✅")
-            await message.add_reaction("❌")
+        if message.author.bot or not suggestion_channel(message):
+            return
+        if (await self.bot.get_context(message)).valid:
+            return  # Commands like !suggestions aren't suggestions
+
+        await message.add_reaction("✅")
+        await message.add_reaction("❌")
+        signature = await duplicates.signature(message.content)
+        result = await database.execute(
+            insert(Suggestion).values(
+                author=message.author.name,
+                date=datetime.now(),
+                description=message.content,
+                message_id=message.id,
+                channel_id=message.channel.id,
+                state="open",
+                signature=duplicates.pack(signature),
+            )
+        )
+        if result is None:
+            return
+        if (open_suggestions := await self.load_open_suggestions()) is not None:
+            open_suggestions.add(message.id)  # Otherwise it's in the next load
+        if not signature:
+            return
+
+        suggestion_id = result.inserted_primary_key[0]
+        try:
+            # Best effort, the suggestion is saved even if it can't be compared
+            matches = [
+                match
+                for match in await duplicates.find(signature)
+                if match[0] != suggestion_id  # Loaded with the index
+            ]
+        except Exception:
+            logger.exception("The duplicates of a suggestion can't be searched")
+            matches = []
+        duplicates.add(suggestion_id, signature)
+        if matches:
+            await self.reply_duplicate(message, *matches[0])
+
+    async def reply_duplicate(self, message, suggestion_id: int, score: float):
+        """
+        Links a new suggestion to the earlier one it looks like
+        """
+        earlier = await database.fetch_one(
+            select(Suggestion).where(Suggestion.id == suggestion_id)
+        )
+        if earlier is None:
+            return
+        if earlier.state == "open" and earlier.message_id:
+            url = (
+                f"https://discord.com/channels/{message.guild.id}/"
+                f"{earlier.channel_id}/{earlier.message_id}"
+            )
+            where = f"une suggestion en cours: {url}"
+        else:
+            decided = "refusée" if earlier.state == "refused" else "acceptée"
+            citation = shorten(earlier.description, 80, placeholder="...")
+            where = f"une suggestion déjà {decided}:\n> {citation}\n"
+        await message.reply(
+            f"Cette suggestion ressemble à {where} (similarité de {score:.0%})",
+            mention_author=False,
+        )
+
+    async def is_vote(self, payload) -> bool:
+        """
+        Checks if a reaction is a vote of a member for an open suggestion
+        """
+        if payload.guild_id is None or str(payload.emoji) not in VOTE_EMOJIS:
+            return False
+        guild = self.bot.get_guild(payload.guild_id)
+        # The reactions of the owner are decisive, they aren't votes
+        return payload.user_id not in (self.bot.user.id, guild.owner_id) and (
+            payload.message_id in (await self.load_open_suggestions() or ())
+        )
 
-    @commands.Cog.listener("on_raw_reaction_add")
+    async def add_vote(self, payload):
+        if await self.is_vote(payload):
+            await database.execute(
+                insert(SuggestionVote)
+                .values(
+                    message_id=payload.message_id,
+                    user_id=payload.user_id,
+                    emoji=str(payload.emoji),
+                )
+                .prefix_with("OR IGNORE", dialect="sqlite")
+                .prefix_with("IGNORE", dialect="mysql")
+            )
+
+    async def remove_vote(self, payload):
+        if await self.is_vote(payload):
+            await database.execute(
+                delete(SuggestionVote).where(
+                    SuggestionVote.message_id == payload.message_id,
+                    SuggestionVote.user_id == payload.user_id,
+                    SuggestionVote.emoji == str(payload.emoji),
+                )
+            )
+
+    @commands.command(name="suggestions")
     @commands.guild_only()
+    async def rank_suggestions(self, ctx, n: int = 10):
+        """
+        Affiche les suggestions en cours les plus soutenues
+        """
+        votes_for = func.count(case((SuggestionVote.emoji == "✅", 1)))
+        votes_against = func.count(case((SuggestionVote.emoji == "❌", 1)))
+        result = await database.execute(
+            select(Suggestion, votes_for, votes_against)
+            .outerjoin(
+                SuggestionVote, SuggestionVote.message_id == Suggestion.message_id
+            )
+            .where(
+                Suggestion.state == "open",
+                Suggestion.channel_id.in_([c.id for c in ctx.guild.text_channels]),
+            )
+            .group_by(Suggestion.id)
+            .order_by((votes_for - votes_against).desc(), votes_for.desc())
+            .limit(min(max(1, n), 25))
+        )
+        rows = result.all() if result is not None else []
+
+        lines = []
+        for suggestion, n_for, n_against in rows:
+            url = (
+                f"https://discord.com/channels/{ctx.guild.id}/"
+                f"{suggestion.channel_id}/{suggestion.message_id}"
+            )
+            description = shorten(suggestion.description, 80, placeholder="...")
+            lines.append(f"**{n_for}** ✅ **{n_against}** ❌ [{description}]({url})")
+        embed = discord.Embed(
+            title="Suggestions en cours",
+            colour=0xFF66FF,
+            description="\n".join(lines) or "Aucune suggestion n'est en cours",
+        )
+        await ctx.send(embed=embed)
+
     async def decisive_reaction(self, payload):
         """
         Send result to all users when the owner add a reaction
         """
+        if str(payload.emoji) not in VOTE_EMOJIS:
+            return
         channel = self.bot.get_channel(payload.channel_id)
-        if (
-            payload.user_id != channel.guild.owner_id
-            or "suggestion" not in channel.name
-        ):
+        if payload.user_id != channel.guild.owner_id:
+            return
+
+        if (open_suggestions := await self.load_open_suggestions()) is None:
+            # Unknown if it's a legacy suggestion, it would be inserted twice
+            logger.error(f"The decision on {payload.message_id} can't be recorded")
             return
 
         message = await channel.fetch_message(payload.message_id)
-        if str(payload.emoji) == "✅":
-            database.execute(
+        state = "accepted" if str(payload.emoji) == "✅" else "refused"
+        if message.id in open_suggestions:
+            open_suggestions.discard(message.id)
+            await database.execute(
+                update(Suggestion)
+                .where(Suggestion.message_id == message.id)
+                .values(state=state)
+            )
+            voters = await database.fetch(
+                select(SuggestionVote.user_id).where(
+                    SuggestionVote.message_id == message.id,
+                    SuggestionVote.emoji == "✅",
+                )
+            )
+        else:
+            # Posted before the votes were recorded, they are read from the reactions
+            signature = await duplicates.signature(message.content)
+            result = await database.execute(
                 insert(Suggestion).values(
-                    author=message.author.name, description=message.content
+                    author=message.author.name,
+                    date=datetime.now(),
+                    description=message.content,
+                    message_id=message.id,
+                    channel_id=channel.id,
+                    state=state,
+                    signature=duplicates.pack(signature),
                 )
             )
+            if result is not None and signature:
+                duplicates.add(result.inserted_primary_key[0], signature)
+            voters = []
+            for reaction in message.reactions:
+                if str(reaction.emoji) == "✅":
+                    voters += [user.id async for user in reaction.users()]
+
+        recipients = {message.author.id, *voters} - {self.bot.user.id}
+        embed = self.suggestion_state_embed(str(payload.emoji), message)
 
-        for reaction in message.reactions:
-            if str(reaction.emoji) == "✅":
-                async for user in reaction.users():
-                    await self.send_dm_suggestion_state(
-                        user, str(payload.emoji), message
-                    )
-        await self.send_dm_suggestion_state(message.author, str(payload.emoji), message)
+        async def send(user_id):
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            await user.send(embed=embed)
+
+        await fan_out(
+            recipients,
+            send,
+            name="suggestion_state",
+            concurrency=CONFIG["fanout"]["dm"]["concurrency"],
+            limiter=self.dm_limiter,
+        )
 
         await message.delete()
 
-    async def send_dm_suggestion_state(self, user, decisive_emoji, suggestion):
+    def suggestion_state_embed(self, decisive_emoji, suggestion):
         """
-        Send a message to a member who has voted to inform of the state of the reaction
+        Returns the message sent to the members who have voted for a suggestion,
+        to inform them of its state
         """
-        if user.id == self.bot.user.id or decisive_emoji not in ("✅", "❌"):
-            return
         citation = "\n> ".join(suggestion.content.split("\n"))
 
         if decisive_emoji == "✅":
@@ -96,7 +303,7 @@ class SuggestionCog(commands.Cog):
                     f"La suggestion de **{suggestion.author.name}** pour laquelle "
                     f"vous avez voté a été acceptée:\n> {citation} \n\n"
                     "__Note__: \n Il faut parfois attendre plusieurs jours "
-                    "avant qu'elle soit effective",
+                    "avant qu'elle soit effective"
                 ),
             )
         else:
@@ -113,8 +320,8 @@ class SuggestionCog(commands.Cog):
         embed.set_footer(
             text=f"{self.bot.user.name} | This message was sent automatically"
         )
-        await user.send(embed=embed)
+        return embed
 
 
 def setup(bot):
-    bot.add_cog(Suggestion(bot))
+    bot.add_cog(SuggestionCog(bot))
@@ -0,0 +1,30 @@
+from typing import Optional
+
+import discord
+
+# Only valid for the streams read over http
+FFMPEG_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+FRAME_LENGTH = discord.opus.Encoder.FRAME_LENGTH / 1000  # Seconds of a frame
+
+
+def open_source(
+    url: str,
+    codec: Optional[str] = None,
+    *,
+    volume=1.0,
+    passthrough=False,
+    before_options: str = None,
+) -> discord.AudioSource:
+    """
+    Opens the ffmpeg source of an audio stream.
+    With passthrough at full volume, ffmpeg outputs Opus directly, which skips
+    the PCM decoding, scaling and encoding done in Python. The codec of the stream
+    is given to FFmpegOpusAudio, which copies the Opus streams instead of encoding
+    them. Otherwise the PCM can be scaled to change the volume
+    """
+    if passthrough and volume == 1.0:
+        return discord.FFmpegOpusAudio(url, codec=codec, before_options=before_options)
+    return discord.PCMVolumeTransformer(
+        discord.FFmpegPCMAudio(url, before_options=before_options), volume=volume
+    )
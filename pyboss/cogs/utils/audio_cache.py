@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from pyboss import CONFIG
+from pyboss.utils.cache import LRUCache
+
+from .audio import FFMPEG_BEFORE_OPTIONS
+from .stream import Stream
+
+logger = logging.getLogger(__name__)
+
+_VIDEO_ID = re.compile(r"[\w-]{1,64}")
+SUFFIX = ".ogg"
+PARTIAL_SUFFIX = ".part"
+
+
+class AudioCache:
+    """
+    Directory of the tracks transcoded in Opus by ffmpeg, named by video id.
+    The files are evicted in LRU order beyond max_bytes, a track is filled in
+    background once it has been played admit_after times
+    """
+
+    def __init__(
+        self,
+        enabled=False,
+        path="cache/music",
+        max_bytes=1 << 30,
+        max_file_bytes=50 << 20,
+        admit_after=2,
+        workers=2,
+        bitrate=128,
+    ):
+        self.enabled = enabled
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.admit_after = admit_after
+        self.bitrate = bitrate
+        self.hits = self.misses = self.evictions = self.fills = self.failures = 0
+        self._files = None  # video id -> size in bytes, least recently used first
+        self._size = 0
+        self._plays = LRUCache(maxsize=4096)  # video id -> plays while not cached
+        self._filling = {}  # video id -> ffmpeg process
+        self._tasks = set()  # Fills running, the loop only keeps weak references
+        self._workers = workers
+        self._semaphore = None  # Created in the loop of the bot
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "files": len(self._files or ()),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "fills": self.fills,
+            "failures": self.failures,
+            "filling": len(self._filling),
+        }
+
+    def _file(self, video_id: str) -> Path:
+        return self.path / f"{video_id}{SUFFIX}"
+
+    def _load(self):
+        # The modification dates keep the LRU order between two runs
+        self.path.mkdir(parents=True, exist_ok=True)
+        for partial in self.path.glob(f".*{PARTIAL_SUFFIX}"):
+            partial.unlink(missing_ok=True)  # Left by an interrupted fill
+        files = sorted(
+            (entry.stat().st_mtime, entry.name[: -len(SUFFIX)], entry.stat().st_size)
+            for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith(SUFFIX)
+        )
+        self._files = OrderedDict((video_id, size) for _, video_id, size in files)
+        self._size = sum(self._files.values())
+        self._evict()
+
+    def __contains__(self, video_id: str) -> bool:
+        if not self.enabled or not _VIDEO_ID.fullmatch(video_id):
+            return False
+        if self._files is None:
+            self._load()
+        return video_id in self._files
+
+    def get(self, video_id: str) -> Optional[Path]:
+        """
+        Returns the file of a track if it's cached
+        """
+        if not self.enabled:
+            return None
+        if video_id not in self:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._files.move_to_end(video_id)
+        path = self._file(video_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # Removed by hand
+            self._size -= self._files.pop(video_id)
+            return None
+        return path
+
+    def admit(self, stream: Stream):
+        """
+        Counts a play of a track which isn't cached, fills it in background
+        once it has been played enough
+        """
+        video_id = stream.video_id
+        if not self.enabled or not _VIDEO_ID.fullmatch(video_id):
+            return
+        if video_id in self._filling or video_id in (self._files or ()):
+            return
+        plays = self._plays.get(video_id, 0, count=False) + 1
+        if plays < self.admit_after:
+            self._plays.put(video_id, plays)
+            return
+        self._plays.pop(video_id)
+        self._filling[video_id] = None
+        task = asyncio.create_task(self._fill(stream))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, stream: Stream):
+        video_id = stream.video_id
+        temporary = self.path / f".{video_id}{PARTIAL_SUFFIX}"
+        if stream.codec == "opus":
+            codec = ["-c:a", "copy"]
+        else:
+            codec = ["-c:a", "libopus", "-b:a", f"{self.bitrate}k"]
+        args = ["-nostdin", "-loglevel", "error", *FFMPEG_BEFORE_OPTIONS.split()]
+        args += ["-i", stream.url, "-vn", *codec, "-fs", str(self.max_file_bytes + 1)]
+        args += ["-f", "ogg", "-y", str(temporary)]
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._workers)
+        try:
+            async with self._semaphore:
+                if self._files is None:
+                    self._load()
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg", *args, stderr=asyncio.subprocess.PIPE
+                )
+                self._filling[video_id] = process
+                _, stderr = await process.communicate()
+
+            size = temporary.stat().st_size if temporary.exists() else 0
+            if process.returncode != 0 or not size or size > self.max_file_bytes:
+                self.failures += 1
+                logger.warning(
+                    f"The track {video_id} can't be cached ({size} bytes): "
+                    f"{stderr.decode(errors='replace').strip()}"
+                )
+                temporary.unlink(missing_ok=True)
+                return
+            temporary.replace(self._file(video_id))
+            self._files[video_id] = size
+            self._size += size
+            self.fills += 1
+            self._evict()
+        except OSError as err:
+            self.failures += 1
+            logger.error(f"The track {video_id} can't be cached: {err}")
+            temporary.unlink(missing_ok=True)
+        finally:
+            self._filling.pop(video_id, None)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._files:
+            video_id, size = self._files.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            # A track being played stays readable by ffmpeg once unlinked
+            self._file(video_id).unlink(missing_ok=True)
+
+    def close(self):
+        """
+        Stops the fills in progress, their partial files are removed at next start
+        """
+        for process in self._filling.values():
+            if process is not None and process.returncode is None:
+                process.kill()
+
+
+audio_cache = AudioCache(**CONFIG["music"]["cache"])
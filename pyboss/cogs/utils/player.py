@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Optional
+
+import discord
+from youtube_dl.utils import DownloadError
+
+from pyboss import CONFIG
+
+from .audio import FFMPEG_BEFORE_OPTIONS, open_source
+from .audio_cache import audio_cache
+from .stream import Stream, resolver, video_id
+
+logger = logging.getLogger(__name__)
+
+
+class Video:
+    """
+    A track of the queue, its stream is resolved when it's about to be played
+    """
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+
+
+def _cleanup_source(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is None and task.result():
+        task.result().cleanup()
+
+
+class Player:
+    """
+    Plays the queue of a guild in its voice client. While a track is played,
+    the stream of the next one is resolved and its ffmpeg source is opened,
+    so it starts as soon as the voice thread hands the end of the track over
+    """
+
+    def __init__(self, voice_client: discord.VoiceClient, on_finish: Callable = None):
+        self.voice_client = voice_client
+        self.queue: deque[Video] = deque()
+        self.current: Optional[Video] = None
+        self.volume = 1.0
+        self.passthrough = CONFIG["music"]["passthrough"]
+        self._on_finish = on_finish
+        self._loop = asyncio.get_running_loop()
+        self._next = None  # (video, task opening its source)
+        self._advancing = None  # Task starting the next track
+
+    def __len__(self):
+        return len(self.queue)
+
+    def open_source(self, stream: Stream) -> discord.AudioSource:
+        return open_source(
+            stream.url,
+            stream.codec,
+            volume=self.volume,
+            passthrough=self.passthrough,
+            before_options=FFMPEG_BEFORE_OPTIONS,
+        )
+
+    def open_file(self, path) -> discord.AudioSource:
+        # The files of the cache are already in Opus
+        return open_source(
+            str(path), "opus", volume=self.volume, passthrough=self.passthrough
+        )
+
+    def set_volume(self, volume: float) -> bool:
+        """
+        Changes the volume of the tracks, returns False if the current one
+        is played in passthrough and keeps its volume until its end
+        """
+        switched = self.passthrough and (volume == 1.0) != (self.volume == 1.0)
+        self.volume = volume
+        if switched:
+            # The prepared track has been opened for the other audio path
+            self._discard_next()
+            self._prefetch()
+        source = self.voice_client.source
+        if isinstance(source, discord.PCMVolumeTransformer):
+            source.volume = volume
+            return True
+        return source is None
+
+    async def _prepare(self, video: Video) -> Optional[discord.AudioSource]:
+        """
+        Opens the source of a track, None if it can't be played and is skipped
+        """
+        try:
+            # Spawning ffmpeg may take a while, it's done out of the event loop
+            if path := audio_cache.get(video_id(video.url)):
+                return await self._loop.run_in_executor(None, self.open_file, path)
+            stream = await resolver.resolve(video.url)
+            audio_cache.admit(stream)
+            return await self._loop.run_in_executor(None, self.open_source, stream)
+        except DownloadError as err:
+            logger.error(f"The stream of {video.url} can't be extracted: {err}")
+        except (discord.ClientException, OSError) as err:
+            # Like ffmpeg missing or failing to start
+            logger.error(f"The track {video.url} can't be opened: {err}")
+        except Exception:
+            logger.exception(f"The track {video.url} can't be prepared")
+        return None
+
+    def _prefetch(self):
+        """
+        Starts preparing the first track of the queue, if it isn't already
+        """
+        if not self.queue or (self._next and self._next[0] is self.queue[0]):
+            return
+        self._discard_next()
+        video = self.queue[0]
+        self._next = (video, asyncio.create_task(self._prepare(video)))
+
+    def _discard_next(self):
+        if self._next is not None:
+            _, task = self._next
+            self._next = None
+            # The source is closed once opened, ffmpeg would be left running otherwise
+            task.add_done_callback(_cleanup_source)
+
+    def add(self, video: Video):
+        self.queue.append(video)
+        if self.current is None and self._advancing is None:
+            self._advancing = asyncio.create_task(self._advance())
+        elif self.current is not None:
+            self._prefetch()
+
+    def skip(self) -> Optional[Video]:
+        """
+        Stops the current track, returns the next one if there is any
+        """
+        self.voice_client.stop()  # The next track is started by _after
+        return self.queue[0] if self.queue else None
+
+    async def stop(self):
+        self.queue.clear()
+        self._discard_next()
+        await self.voice_client.disconnect()
+
+    def _after(self, error: Optional[Exception]):
+        # Called by the voice thread at the end of a track
+        if error is not None:
+            logger.error(f"The track {self.current.url} has been interrupted: {error}")
+        self._loop.call_soon_threadsafe(self._on_track_end)
+
+    def _on_track_end(self):
+        self.current = None
+        if self._advancing is None:
+            self._advancing = asyncio.create_task(self._advance())
+
+    async def _advance(self):
+        """
+        Starts the next playable track, or disconnects if the queue is empty
+        """
+        try:
+            while self.queue:
+                self._prefetch()
+                video, task = self._next
+                # Already done when the track has been prefetched, doesn't wait
+                source = await task
+                if self._next is None or self._next[1] is not task:
+                    continue  # Discarded meanwhile, the source is cleaned up
+                self._next = None
+                self.queue.popleft()
+                if source is None:
+                    continue
+                if not self.voice_client.is_connected():
+                    source.cleanup()
+                    break
+                if isinstance(source, discord.PCMVolumeTransformer):
+                    source.volume = self.volume  # May have changed since it's opened
+                self.current = video
+                self.voice_client.play(source, after=self._after)
+                self._prefetch()
+                return
+            await self.voice_client.disconnect()
+            if self._on_finish is not None:
+                self._on_finish(self)
+        finally:
+            self._advancing = None
@@ -0,0 +1,103 @@
+import random
+
+from sqlalchemy import select
+
+from pyboss.models import Quiz
+from pyboss.utils import database
+
+
+def letter_emoji(letter: str) -> str:
+    """
+    Returns the regional indicator emoji of a letter, like 🇦 for A
+    """
+    return chr(ord("🇦") + ord(letter.upper()) - ord("A"))
+
+
+class Deck:
+    """
+    Draws the ids of a shared list without replacement, like a shuffled deck.
+    The shuffle is lazy (sparse Fisher-Yates): a draw costs O(1) and the deck
+    only stores the positions swapped since it was last reset
+    """
+
+    def __init__(self, ids: list[int]):
+        self._ids = ids
+        self._size = len(ids)
+        self._remaining = self._size
+        self._swaps = {}  # position -> position of the id now at this place
+
+    def __len__(self):
+        self._sync()
+        return self._remaining
+
+    def _sync(self):
+        # Ids appended to the shared list are placed among the ones not drawn yet
+        for position in range(self._size, len(self._ids)):
+            self._swaps[self._remaining] = position
+            self._remaining += 1
+            self._size += 1
+
+    def draw(self) -> int:
+        self._sync()
+        if not self._size:
+            raise IndexError("draw from an empty deck")
+        if not self._remaining:  # All ids have been drawn, shuffles again
+            self._remaining = self._size
+            self._swaps.clear()
+
+        index = random.randrange(self._remaining)
+        self._remaining -= 1
+        last = self._remaining
+        drawn = self._swaps.get(index, index)
+        self._swaps[index] = self._swaps.pop(last, last)
+        return self._ids[drawn]
+
+
+class QuestionBank:
+    """
+    Index of the quiz ids kept in memory, each channel draws from its own deck
+    """
+
+    def __init__(self):
+        self._ids = None
+        self._decks = {}  # channel id -> Deck
+
+    async def load(self):
+        result = await database.execute(select(Quiz.id))
+        if result is None:
+            return  # Not loaded, the next draw tries again
+        self._ids = list(result.scalars())
+        self._decks.clear()
+
+    def add(self, quiz_id: int):
+        """
+        Adds a new question to the decks, if the bank is already loaded
+        """
+        if self._ids is not None:
+            self._ids.append(quiz_id)
+
+    async def draw(self, channel_id: int, n=1) -> list[Quiz]:
+        """
+        Returns n questions that the channel hasn't seen since its deck was shuffled
+        """
+        if self._ids is None:
+            await self.load()
+            if self._ids is None:
+                return []
+        deck = self._decks.setdefault(channel_id, Deck(self._ids))
+
+        ids = []
+        while len(ids) < min(n, len(self._ids)):
+            # A reshuffle may give back an id already drawn for this party
+            if (quiz_id := deck.draw()) not in ids:
+                ids.append(quiz_id)
+
+        quizzes = {
+            quiz.id: quiz
+            for quiz in await database.fetch(select(Quiz).where(Quiz.id.in_(ids)))
+        }
+        # Keeps the order of the draw, deleted rows are ignored
+        return [quizzes[quiz_id] for quiz_id in ids if quiz_id in quizzes]
+
+
+bank = QuestionBank()
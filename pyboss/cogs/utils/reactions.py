@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+import discord
+
+from pyboss.controllers.special import specials
+from pyboss.utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+ADD, REMOVE = "REACTION_ADD", "REACTION_REMOVE"  # RawReactionActionEvent.event_type
+BOTH = (ADD, REMOVE)
+
+REACTIONS_DISPATCHED = Counter(
+    "reactions_dispatched_total", "Raw reaction events sent to each handler"
+)
+REACTION_HANDLER_SECONDS = Histogram(
+    "reaction_handler_seconds", "Time spent by the reaction handlers"
+)
+
+Handler = Callable[[discord.RawReactionActionEvent], Awaitable]
+
+
+def _handler_name(handler: Handler) -> str:
+    return getattr(handler, "__qualname__", repr(handler))
+
+
+class ReactionRouter:
+    """
+    Sends each raw reaction event only to the handlers watching its message,
+    by id or by name in the specials registry, or its class of channel.
+    The bot calls dispatch for all the reactions instead of each cog filtering them
+    """
+
+    def __init__(self):
+        # (event type, key) -> handlers, the key is a message id, a name or a class
+        self._messages = defaultdict(list)
+        self._specials = defaultdict(list)
+        self._channels = defaultdict(list)
+        self._classes = {"dm": None}  # Class name -> predicate on the channel
+        self._channel_classes = {}  # channel id -> class names, cached
+
+    def add_channel_class(self, name: str, predicate: Callable[..., bool]):
+        """
+        Declares a class of guild channels, predicate is called with the channel
+        """
+        self._classes[name] = predicate
+        self._channel_classes.clear()
+
+    def forget_channel(self, channel_id: int):
+        """
+        Classifies a channel again at its next reaction, after it has been renamed
+        """
+        self._channel_classes.pop(channel_id, None)
+
+    @staticmethod
+    def _watch(registry: dict, key, handler: Handler, events: tuple):
+        for event in events:
+            if handler not in registry[event, key]:
+                registry[event, key].append(handler)
+
+    def watch_message(self, message_id: int, handler: Handler, events=(ADD,)):
+        self._watch(self._messages, message_id, handler, events)
+
+    def watch_special(self, name: str, handler: Handler, events=(ADD,)):
+        self._watch(self._specials, name, handler, events)
+
+    def watch_channels(self, class_name: str, handler: Handler, events=(ADD,)):
+        self._watch(self._channels, class_name, handler, events)
+
+    def unwatch_message(self, message_id: int):
+        for event in BOTH:
+            self._messages.pop((event, message_id), None)
+
+    def unwatch_all(self, owner):
+        """
+        Removes the handlers which are methods of owner, like a cog being unloaded
+        """
+        for registry in (self._messages, self._specials, self._channels):
+            for key, handlers in tuple(registry.items()):
+                handlers[:] = [
+                    h for h in handlers if getattr(h, "__self__", None) is not owner
+                ]
+                if not handlers:
+                    del registry[key]
+
+    def classes_of(self, bot, payload: discord.RawReactionActionEvent) -> tuple:
+        try:
+            return self._channel_classes[payload.channel_id]
+        except KeyError:
+            pass
+        if payload.guild_id is None:
+            classes = ("dm",)
+        elif (channel := bot.get_channel(payload.channel_id)) is None:
+            return ()
+        else:
+            classes = tuple(
+                name
+                for name, predicate in self._classes.items()
+                if predicate is not None and predicate(channel)
+            )
+        self._channel_classes[payload.channel_id] = classes
+        return classes
+
+    def handlers_for(self, bot, payload: discord.RawReactionActionEvent) -> list:
+        event = payload.event_type
+        handlers = list(self._messages.get((event, payload.message_id), ()))
+        if name := specials.name_of(payload.message_id):
+            handlers += self._specials.get((event, name), ())
+        for class_name in self.classes_of(bot, payload):
+            handlers += self._channels.get((event, class_name), ())
+        return handlers
+
+    async def dispatch(self, bot, payload: discord.RawReactionActionEvent):
+        if handlers := self.handlers_for(bot, payload):
+            await asyncio.gather(*(self._run(h, payload) for h in handlers))
+
+    @staticmethod
+    async def _run(handler: Handler, payload: discord.RawReactionActionEvent):
+        name = _handler_name(handler)
+        REACTIONS_DISPATCHED.inc(handler=name)
+        with REACTION_HANDLER_SECONDS.time(handler=name):
+            try:
+                await handler(payload)
+            except Exception:
+                logger.exception(f"The reaction handler {name} has failed")
+
+
+router = ReactionRouter()
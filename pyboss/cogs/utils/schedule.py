@@ -4,7 +4,6 @@ import logging
 import re
 
 from pyboss import STATIC_DIR
-from pyboss.controllers.member import MemberController
 
 REGEX_HOUR = re.compile(
     r"^(?P<start>[0-1]?[0-9]|2[0-4])[hH]?[-àa; /:]*(?P<end>[0-1]?[0-9]|2[0-4])?[hH]?$"
@@ -27,16 +26,17 @@ def check_matter(schedule, msg):
     Check if the user write a correct matter and place him in blacklist if not.
     """
     content = msg.content.upper()
-    member_ctrl = MemberController(msg.author)
+    member_ctrl = schedule.member_ctrl
 
     with open(STATIC_DIR / "json/matters.json", encoding="utf-8") as wordlist:
         matters_wordlist = json.load(wordlist)
     if matters_wordlist.get(content):
-        schedule.answers["matter"] = matters_wordlist[content]
+        schedule.answers["subject"] = matters_wordlist[content]
 
     elif not member_ctrl.blacklist_date:
-        member_ctrl.place_in_blacklist()
-        schedule.answers["matter"] = content.title()
+        # The author is placed in blacklist once the procedure is completed
+        schedule.blacklist_author = True
+        schedule.answers["subject"] = content.title()
     else:
         timedelta = member_ctrl.blacklist_date - datetime.datetime.now()
         hours, minutes = (
@@ -73,7 +73,7 @@ def check_date(schedule, msg):
 
     if date_user.weekday() < 5:
         if date_user >= datetime.date.today():
-            schedule.answers["date"] = str(date_user)
+            schedule.answers["date"] = date_user  # For the Date columns
             return True
         schedule.custom_response = (
             f"{day}/{month} est antérieur à la date d'aujourd'hui"
@@ -94,9 +94,9 @@ def check_hours(schedule, msg):
     else:
         # verifying if endhour exists or calculate it
         if not endhour:
-            endhour = str(starthour + 1)
-        schedule.answers["starthour"] = starthour + "h"
-        schedule.answers["endhour"] = endhour + "h"
+            endhour = starthour + 1
+        schedule.answers["starthour"] = starthour
+        schedule.answers["endhour"] = endhour
         return True
 
 
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+import youtube_dl
+
+from pyboss import CONFIG
+from pyboss.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+YTDL_OPTIONS = {
+    "format": "bestaudio/best",
+    "noplaylist": True,
+    "quiet": True,
+    "no_warnings": True,
+}
+
+# Signed urls of googlevideo carry their expiration as ?expire= or /expire/
+_EXPIRE_PATH = re.compile(r"/expire/(\d+)")
+
+
+class Stream(NamedTuple):
+    video_id: str
+    url: str  # Signed url of the audio stream, read by ffmpeg
+    expires_at: Optional[float] = None  # Timestamp
+    codec: Optional[str] = None  # Audio codec given by youtube_dl, like "opus"
+
+
+def video_id(url: str) -> str:
+    """
+    Returns the id of a youtube video url, or the url itself if it has none
+    """
+    parsed = urlparse(url)
+    if parsed.hostname == "youtu.be":
+        return parsed.path.lstrip("/") or url
+    return parse_qs(parsed.query).get("v", [url])[0]
+
+
+def expiration_of(stream_url: str) -> Optional[float]:
+    if expire := parse_qs(urlparse(stream_url).query).get("expire"):
+        return float(expire[0])
+    if match := _EXPIRE_PATH.search(stream_url):
+        return float(match[1])
+    return None
+
+
+class StreamResolver:
+    """
+    Extracts the stream urls with youtube_dl in a bounded thread pool, out of
+    the event loop. The urls are cached by video id until margin seconds before
+    their signature expires, concurrent resolutions of a video are shared
+    """
+
+    def __init__(
+        self,
+        workers=2,
+        maxsize=256,
+        ttl=3600.0,
+        margin=300.0,
+        extractor: Callable[[str], dict] = None,
+    ):
+        self.margin = margin
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="ytdl")
+        self._cache = LRUCache(maxsize, ttl)
+        self._pending = {}  # video id -> future of the resolution
+        if extractor is None:
+            ytdl = youtube_dl.YoutubeDL(YTDL_OPTIONS)
+            extractor = partial(ytdl.extract_info, download=False)
+        self._extract = extractor
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+    async def resolve(self, url: str) -> Stream:
+        """
+        Returns the stream of a video, raises youtube_dl.utils.DownloadError on failure
+        """
+        key = video_id(url)
+        if (stream := self._cache.get(key)) is not None:
+            return stream
+        if (future := self._pending.get(key)) is None:
+            future = asyncio.ensure_future(self._resolve(key, url))
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _resolve(self, key: str, url: str) -> Stream:
+        loop = asyncio.get_running_loop()
+        info = await loop.run_in_executor(self._executor, self._extract, url)
+        stream_url = info.get("url") or info["formats"][-1]["url"]
+        codec = info.get("acodec") if info.get("acodec") != "none" else None
+        stream = Stream(key, stream_url, expiration_of(stream_url), codec)
+
+        ttl = None
+        if stream.expires_at is not None:
+            ttl = stream.expires_at - time.time() - self.margin
+            if self._cache.ttl is not None:
+                ttl = min(ttl, self._cache.ttl)
+        if ttl is None or ttl > 0:
+            self._cache.put(key, stream, ttl)
+        return stream
+
+    def invalidate(self, url: str):
+        """
+        Forgets the stream of a video, when its url has been refused by the server
+        """
+        self._cache.pop(video_id(url))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+resolver = StreamResolver(**CONFIG["music"]["resolver"])
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import bindparam, select, update
+
+from pyboss import CONFIG
+from pyboss.models import Suggestion
+from pyboss.utils import database
+from pyboss.utils.minhash import LSHIndex, MinHasher
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateIndex:
+    """
+    MinHash signatures of all the suggestions in a LSH index, to find the ones
+    similar to a new suggestion. The signatures are stored with the suggestions,
+    the missing ones are computed and stored when the index is loaded
+    """
+
+    def __init__(self, permutations=64, bands=16, shingle_size=4, threshold=0.6):
+        self.hasher = MinHasher(permutations, shingle_size)
+        self.threshold = threshold
+        self._index = LSHIndex(bands)
+        self._loading = None
+
+    def __len__(self):
+        return len(self._index)
+
+    async def load(self):
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        loading = self._loading
+        try:
+            loaded = await loading
+        except Exception:
+            logger.exception("The index of the suggestions can't be loaded")
+            loaded = False
+        if not loaded and self._loading is loading:
+            self._loading = None  # A failed load is tried again at the next use
+
+    async def _load(self) -> bool:
+        result = await database.execute(
+            select(Suggestion.id, Suggestion.description, Suggestion.signature)
+        )
+        if result is None:
+            return False  # The failure has been logged by the database module
+        missing = {}  # suggestion id -> description
+        for suggestion_id, description, data in result:
+            if (signature := self.hasher.unpack(data)) is not None:
+                self._index.add(suggestion_id, signature)
+            elif description:
+                missing[suggestion_id] = description
+        if not missing:
+            return True
+
+        # Computed out of the event loop, it takes about a millisecond per text
+        signatures = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: {id: self.hasher.signature(t) for id, t in missing.items()}
+        )
+        params = []
+        for suggestion_id, signature in signatures.items():
+            if signature is not None:
+                self._index.add(suggestion_id, signature)
+                packed = self.hasher.pack(signature)
+                params.append({"suggestion_id": suggestion_id, "packed": packed})
+        if params:
+            # Only saves computing them again at the next start if it fails
+            table = Suggestion.__table__
+            await database.execute(
+                update(table)
+                .where(table.c.id == bindparam("suggestion_id"))
+                .values(signature=bindparam("packed")),
+                params,
+            )
+        return True
+
+    async def signature(self, text: str) -> Optional[tuple[int, ...]]:
+        """
+        Computes the signature of a text out of the event loop,
+        it takes milliseconds for a long message
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.hasher.signature, text)
+
+    def pack(self, signature: Optional[tuple[int, ...]]) -> Optional[bytes]:
+        return self.hasher.pack(signature) if signature is not None else None
+
+    async def find(self, signature: tuple[int, ...]) -> list[tuple[int, float]]:
+        """
+        Returns the (suggestion id, similarity) of the suggestions similar
+        to this signature, the most similar first
+        """
+        await self.load()
+        return self._index.query(signature, self.threshold)
+
+    def add(self, suggestion_id: int, signature: tuple[int, ...]):
+        self._index.add(suggestion_id, signature)
+
+
+duplicates = DuplicateIndex(**CONFIG["suggestions"]["duplicates"])
@@ -1,28 +1,78 @@
+import asyncio
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from pyboss import CONFIG
+from pyboss.utils.cache import LRUCache
+
 logger = logging.getLogger(__name__)
 
 
-def search(query: str, n=1) -> dict:
+class YoutubeClient:
     """
-    Search video on youtube matching the query
+    Client of the Youtube Data API built once and reused by all searches.
+    The requests run in a dedicated thread since the service isn't thread safe,
+    their results are cached by (query, n). The http transport can be injected,
+    like a googleapiclient.http.HttpMock
     """
-    try:
-        youtube = build("youtube", "v3", developerKey=os.getenv("API_DEVELOPER_KEY"))
+
+    def __init__(self, maxsize=256, ttl=3600.0, developer_key: str = None, http=None):
+        self._developer_key = developer_key
+        self._http = http
+        self._service = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="youtube")
+        self._cache = LRUCache(maxsize, ttl)
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+    def _search(self, query: str, n: int) -> list[dict]:
+        if self._service is None:
+            # The discovery document is only fetched for the first search
+            self._service = build(
+                "youtube",
+                "v3",
+                developerKey=self._developer_key or os.getenv("API_DEVELOPER_KEY"),
+                http=self._http,
+                cache_discovery=False,
+            )
         response = (
-            youtube.search()
+            self._service.search()
             .list(part="snippet", q=query, type="video", maxResults=n)
             .execute()
         )
-    except HttpError:
-        logger.error("You're Youtube API developer key is undefined or invalid")
-    else:
-        for video in response["items"]:
-            yield {
+        return [
+            {
                 "name": video["snippet"]["title"],
                 "url": f"https://www.youtube.com/watch?v={video['id']['videoId']}",
             }
+            for video in response["items"]
+        ]
+
+    async def search(self, query: str, n=1) -> list[dict]:
+        """
+        Search videos on youtube matching the query
+        """
+        key = (query.strip().lower(), n)
+        if (videos := self._cache.get(key)) is not None:
+            return list(videos)
+        loop = asyncio.get_running_loop()
+        try:
+            videos = await loop.run_in_executor(self._executor, self._search, query, n)
+        except HttpError:
+            logger.error("You're Youtube API developer key is undefined or invalid")
+            return []
+        self._cache.put(key, tuple(videos))
+        return videos
+
+
+client = YoutubeClient(**CONFIG["youtube"]["search"])
+
+
+async def search(query: str, n=1) -> list[dict]:
+    return await client.search(query, n)
@@ -1,5 +1,6 @@
-from functools import cache
-from typing import Union
+from __future__ import annotations
+
+from typing import Optional
 
 import discord
 
@@ -7,25 +8,65 @@ from .member import MemberController
 
 
 class GuildController:
+    """
+    Wraps a guild with an index of its members by name.
+    Only one controller lives per guild, use GuildController.of(guild) to get it
+    """
+
+    _instances: dict[int, GuildController] = {}
+
     def __init__(self, guild: discord.Guild):
         self.guild = guild
-        self.members = tuple(map(MemberController, guild.members))
+        # name -> member id, built at the first lookup then kept up to date by events
+        self._names: Optional[dict[str, int]] = None
 
     def __getattr__(self, name: str):
         return getattr(self.guild, name)
 
-    @cache
-    def get_member_by_name(self, member: str) -> Union[MemberController, None]:
+    @classmethod
+    def of(cls, guild: discord.Guild) -> GuildController:
+        """
+        Returns the controller shared by all cogs for this guild
+        """
         try:
-            return discord.utils.get(self.members, name=member)
-        except AttributeError:
-            return None
+            controller = cls._instances[guild.id]
+        except KeyError:
+            controller = cls._instances[guild.id] = cls(guild)
+        controller.guild = guild  # The guild object may be renewed after a reconnect
+        return controller
 
-    @cache
-    def get_member_by_id(self, member: int) -> Union[MemberController, None]:
-        try:
-            return discord.utils.get(self.members, id=member)
-        except AttributeError:
-            return None
+    @classmethod
+    def all(cls) -> tuple[GuildController, ...]:
+        return tuple(cls._instances.values())
+
+    @property
+    def names(self) -> dict[str, int]:
+        if self._names is None:
+            # Reversed so the first member with a name wins, like discord.utils.get
+            self._names = {m.name: m.id for m in reversed(self.guild.members)}
+        return self._names
+
+    def add_member(self, member: discord.abc.User):
+        if self._names is not None:
+            self._names.setdefault(member.name, member.id)
+
+    def remove_member(self, member: discord.abc.User):
+        if self._names is not None and self._names.get(member.name) == member.id:
+            del self._names[member.name]
+
+    def rename_member(self, before: discord.abc.User, after: discord.abc.User):
+        if before.name != after.name:
+            self.remove_member(before)
+            self.add_member(after)
+
+    async def get_member_by_name(self, member: str) -> Optional[MemberController]:
+        if member_id := self.names.get(member):
+            return await self.get_member_by_id(member_id)
+        return None
+
+    async def get_member_by_id(self, member: int) -> Optional[MemberController]:
+        if discord_member := self.guild.get_member(member):
+            return await MemberController.load(discord_member)
+        return None
 
     # TODO: add methods publish_channel() etc...
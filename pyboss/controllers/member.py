@@ -1,17 +1,43 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from functools import cache
-from threading import Timer
-from typing import Iterable, NoReturn, Optional, Union
+from typing import Iterable, Optional, Union
 
 import discord
-import sqlalchemy.exc
-from cached_property import cached_property
 from sqlalchemy import insert, select, update
 
+from pyboss import CONFIG
 from pyboss.models import Member
 from pyboss.utils import database
+from pyboss.utils.cache import LRUCache
+from pyboss.utils.leaderboard import leaderboard
+from pyboss.utils.ledger import ledger, level_for
+from pyboss.utils.scheduler import scheduler
+
+# Identity map of the members rows, all controllers of a member share its row
+members_cache = LRUCache(**CONFIG["cache"]["members"])
+
+
+def _apply_settlement(settled: dict[int, tuple[int, int]]):
+    """
+    Updates in place the cached rows with the XP written by the ledger
+    """
+    for member_id, (xp, level) in settled.items():
+        if model := members_cache.get(member_id, count=False):
+            model.XP, model.level = xp, level
+
+
+ledger.listeners.append(_apply_settlement)
+
+
+@scheduler.handler("blacklist")
+async def _remove_from_blacklist(key: str, _payload):
+    member_id = int(key)
+    await database.execute(
+        update(Member).where(Member.id == member_id).values(blacklist=None)
+    )
+    if model := members_cache.get(member_id, count=False):
+        model.blacklist = None
 
 
 class MemberController:
@@ -20,129 +46,145 @@ class MemberController:
     for the database for attributes like XP, level, roles and blacklist date
     """
 
-    def __init__(self, member: discord.Member):
+    def __init__(self, member: discord.Member, model: Optional[Member] = None):
         """
-        Represente a member with additional attributes
+        Represente a member with additional attributes,
+        use MemberController.load() to fetch them from the database
         """
         self.member = member
-        self.__model = self._fetch()
+        self.__model = model
 
     def __getattr__(self, name: str):
         return getattr(self.member, name)
 
-    def _fetch(self) -> Optional[Member]:
+    @classmethod
+    async def load(cls, member: discord.Member) -> MemberController:
         """
-        Fetch from the database and returns the member if exists
+        Creates a controller and fetches the member row from the database
         """
-        try:
-            return database.execute(
-                select(Member).where(Member.id == self.member.id)
-            ).scalar_one
-        except sqlalchemy.exc.NoResultFound:
-            return None
+        if model := members_cache.get(member.id):
+            return cls(member, model)
+        controller = cls(member)
+        await controller.refresh()
+        return controller
 
-    def update(self, **kwargs):
+    async def refresh(self):
+        """
+        Fetch from the database the member row, None if it does not exist
+        """
+        self.__model = await database.fetch_one(
+            select(Member).where(Member.id == self.member.id)
+        )
+        if self.__model is not None:
+            members_cache.put(self.member.id, self.__model)
+        else:
+            members_cache.pop(self.member.id)
+
+    async def update(self, **kwargs):
         """
         Accept keyword arguments only matching with a column in members table
         """
-        database.execute(
+        result = await database.execute(
             update(Member).where(Member.id == self.member.id).values(**kwargs)
         )
-
-    def register(self) -> NoReturn:
+        if result is None:
+            # The row is no longer known, it will be fetched again
+            members_cache.pop(self.member.id)
+        else:
+            # The row of the cache is shared by all controllers. This one may
+            # hold a row which has expired and been loaded again, it's replaced
+            if model := members_cache.get(self.member.id, count=False):
+                self.__model = model
+            if self.__model is not None:
+                for column, value in kwargs.items():
+                    setattr(self.__model, column, value)
+
+    async def register(self):
         """
         Insert the member in table, with optionals attributes
         """
-        database.execute(
+        await database.execute(
             insert(Member).values(id=self.member.id, name=self.member.name)
         )
-        self.__model = self._fetch()  # Update the model
+        await self.refresh()  # Update the model
+        if self.exists():
+            leaderboard.update(self.member.id, self.__model.XP or 0, self.member.name)
 
     def exists(self) -> bool:
         return self.__model is not None
 
-    @cache
     def get_role_by_name(self, name: str) -> Optional[discord.Role]:
-        for role in self.member.guild.roles:
-            if role.name == name:
-                return role
-        return None
+        return discord.utils.get(self.member.guild.roles, name=name)
 
-    def place_in_blacklist(self, *, days=1, minutes=0):
+    async def place_in_blacklist(self, *, days=1, minutes=0):
         blacklist = datetime.now() + timedelta(days=days, minutes=minutes)
-        self.update(blacklist=blacklist)
-        Timer(
-            (self._blacklist - datetime.now()).seconds, self._remove_from_blacklist
-        ).start()
-
-    def _remove_from_blacklist(self):
-        self.update(blacklist="Null")
+        await self.update(blacklist=blacklist)
+        # Persisted, the expiration is not lost if the bot restarts
+        await scheduler.schedule("blacklist", blacklist, key=self.member.id)
 
     @property
     def blacklist_date(self) -> Optional[datetime]:
-        if self.__model.blacklist < datetime.now():
-            self._remove_from_blacklist()
+        # The row is kept in memory and cleared by the scheduler at expiration
+        blacklist = self.__model.blacklist if self.__model else None
+        if blacklist is None or blacklist < datetime.now():
             return None
-        return self.__model.blacklist
+        return blacklist
 
     @property
     def top_role(self) -> discord.Role:
-        return self.get_role_by_name(self._top_role_name)
+        return self.get_role_by_name(self.__model.top_role)
 
-    @top_role.setter
-    def top_role(self, role: Union[discord.Role, str]):
+    async def set_top_role(self, role: Union[discord.Role, str]):
         top_role_name = role if isinstance(role, str) else role.name
-        self.update(top_role=top_role_name)
+        await self.update(top_role=top_role_name)
 
     @property
     def group_role(self) -> discord.Role:
-        return self.get_role_by_name(self._group_role_name)
+        return self.get_role_by_name(self.__model.group_role)
 
-    @group_role.setter
-    def group_role(self, role: Union[discord.Role, str]):
+    async def set_group_role(self, role: Union[discord.Role, str]):
         group_role_name = role if isinstance(role, str) else role.name
-        self.update(group_role=group_role_name)
+        await self.update(group_role=group_role_name)
 
     @property
     def sub_roles(self) -> set[discord.Role]:
-        sub_roles_names = self.__models.sub_roles.split(", ")
-        return set(map(self.get_role_by_name, sub_roles_names))
+        if not self.__model.sub_roles:
+            return set()
+        sub_roles_names = self.__model.sub_roles.split(", ")
+        return set(filter(None, map(self.get_role_by_name, sub_roles_names)))
 
-    @sub_roles.setter
-    def sub_roles(self, roles: Iterable[discord.Role]):
+    async def set_sub_roles(self, roles: Iterable[discord.Role]):
         sub_roles_names = database.array_to_string(roles, "name")
-        self.update(sub_roles=sub_roles_names)
+        await self.update(sub_roles=sub_roles_names)
 
     @property
     def validate_state(self):
         return self.__model.validate_state
 
-    @validate_state.setter
-    def validate_state(self, value):
-        self.update(validate_state=value)
-
     @property
     def level(self):
+        if ledger.pending(self.member.id):
+            return level_for(self.XP)
         return self.__model.level
 
     @property
     def XP(self):
-        return self.__model.XP
+        # Includes the XP of the ledger which is not yet written in database
+        return max(self.__model.XP + ledger.pending(self.member.id), 0)
 
-    @XP.setter
-    def XP(self, value):
-        value = max(value, 0)
-        level = int(value ** (1 / 2) / 50) + 1
-        self.update(XP=value, level=level)
+    def add_xp(self, value: int):
+        """
+        Adds (or removes if negative) XP to the member, the level is updated
+        when the ledger is settled
+        """
+        ledger.add(self.member.id, value)
 
     @property
     def dm_choice_msg_id(self) -> int:
-        return self.__model.dm_choice_msg_id
+        return self.__model.choice_msg_id
 
-    @dm_choice_msg_id.setter
-    def dm_choice_msg_id(self, message_id: int):
-        self.update(choice_msg_id=message_id)
+    async def set_dm_choice_msg_id(self, message_id: int):
+        await self.update(choice_msg_id=message_id)
 
-    @cached_property
-    async def dm_choice_msg(self) -> discord.Message:
-        return await self.fetch_message(self.dm_choice_msg_id)
+    async def fetch_dm_choice_msg(self) -> discord.Message:
+        return await self.member.fetch_message(self.dm_choice_msg_id)
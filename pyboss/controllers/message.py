@@ -1,34 +1,36 @@
 import datetime
-from typing import NoReturn
 
 import discord
-from sqlalchemy import insert
 
+from pyboss import CONFIG
 from pyboss.models import Message
-from pyboss.utils import database
+from pyboss.utils.buffer import BatchWriter
+
+# Messages are logged in batches, one INSERT per message was the main DB load
+message_sink = BatchWriter(Message.__table__, **CONFIG["buffer"]["messages"])
 
 
 class MessageController:
     def __init__(self, message: discord.Message):
-        self.member = message
+        self.message = message
 
     def __getattr__(self, name: str):
         return getattr(self.message, name)
 
-    def insert(self) -> NoReturn:
+    async def insert(self):
         """
-        Inserts a message row in messages table
+        Buffers a message row, inserted later in messages table
         """
         channel = (
             "DMChannel"
             if isinstance(self.message.channel, discord.DMChannel)
             else self.message.channel.name
         )
-        database.execute(
-            insert(Message).values(
-                author_id=self.message.author.id,
-                channel=channel,
-                date=datetime.datetime.now(),
-                content=self.message.content,
-            )
+        await message_sink.put(
+            {
+                "author_id": self.message.author.id,
+                "channel": channel,
+                "date": datetime.datetime.now(),
+                "content": self.message.content,
+            }
         )
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert, select, update
+
+from pyboss.models import Special
+from pyboss.utils import database
+
+
+class SpecialRegistry:
+    """
+    The special messages (like guild_choice or the agendas) by name and by id,
+    loaded once at startup then updated when they are written
+    """
+
+    def __init__(self):
+        self._ids = {}  # name -> message id
+        self._names = {}  # message id -> name
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._names
+
+    async def load(self):
+        result = await database.execute(select(Special.name, Special.message_id))
+        self._ids = {name: message_id for name, message_id in result or ()}
+        self._names = {message_id: name for name, message_id in self._ids.items()}
+
+    def get(self, name: str) -> Optional[int]:
+        """
+        Returns the id of the special message with this name
+        """
+        return self._ids.get(name)
+
+    def name_of(self, message_id: int) -> Optional[str]:
+        return self._names.get(message_id)
+
+    async def set(self, name: str, message_id: int) -> Optional[int]:
+        """
+        Replaces the special message with this name, returns the id of the previous one
+        """
+        previous = self._ids.get(name)
+        if name in self._ids:
+            stmt = update(Special).where(Special.name == name)
+        else:
+            stmt = insert(Special).values(name=name)
+        stmt = stmt.values(message_id=message_id, date=datetime.now())
+        if await database.execute(stmt) is not None:
+            self._names.pop(previous, None)
+            self._ids[name] = message_id
+            self._names[message_id] = name
+        return previous
+
+
+specials = SpecialRegistry()
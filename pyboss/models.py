@@ -1,16 +1,32 @@
-from sqlalchemy import BigInteger, Column, Date, DateTime, Integer, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+# SQLite only autoincrements an INTEGER PRIMARY KEY, BIGINT is kept elsewhere
+AutoIncrementId = BigInteger().with_variant(Integer, "sqlite")
+
 
 class Member(Base):
     __tablename__ = "members"
+    __table_args__ = (Index("ix_members_XP", "XP"),)  # Ranks of the cold leaderboard
 
     id: int = Column(BigInteger, primary_key=True)
     name: str = Column(String(50), unique=True)
     top_role: str = Column(String(50), nullable=True)
+    group_role: str = Column(String(50), nullable=True)
     sub_roles: str = Column(Text, nullable=True)
+    validate_state: int = Column(Integer, default=0)
     level: int = Column(Integer, default=0)
     XP: int = Column(Integer, default=0)
     blacklist = Column(DateTime, nullable=True)
@@ -22,8 +38,9 @@ class Member(Base):
 
 class Agenda(Base):
     __tablename__ = "agenda"
+    __table_args__ = (Index("ix_agenda_class_name_date", "class_name", "date"),)
 
-    id: int = Column(BigInteger, primary_key=True)
+    id: int = Column(AutoIncrementId, primary_key=True, autoincrement=True)
     class_name: str = Column(String(30))
     subject: str = Column(String(50))
     date = Column(Date)
@@ -37,8 +54,9 @@ class Agenda(Base):
 
 class Planning(Base):
     __tablename__ = "planning"
+    __table_args__ = (Index("ix_planning_class_name_date", "class_name", "date"),)
 
-    id: int = Column(BigInteger, primary_key=True)
+    id: int = Column(AutoIncrementId, primary_key=True, autoincrement=True)
     class_name: str = Column(String(30))
     subject: str = Column(String(50))
     date = Column(Date)
@@ -54,8 +72,9 @@ class Planning(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_author_id_date", "author_id", "date"),)
 
-    id: int = Column(BigInteger, primary_key=True)
+    id: int = Column(AutoIncrementId, primary_key=True, autoincrement=True)
     author_id: int = Column(BigInteger)  # foreign_key=Member.id
     channel: str = Column(String(50))
     date = Column(DateTime)
@@ -70,7 +89,7 @@ class Message(Base):
 class Quiz(Base):
     __tablename__ = "quiz"
 
-    id: int = Column(BigInteger, primary_key=True, autoincrement=True)
+    id: int = Column(AutoIncrementId, primary_key=True, autoincrement=True)
     author: str = Column(String(50), default="Anonyme")
     theme: str = Column(String(80), nullable=True)
     question: str = Column(Text, unique=True)
@@ -87,7 +106,7 @@ class Special(Base):
     __tablename__ = "specials"
 
     message_id: int = Column(BigInteger, primary_key=True)
-    name: str = Column(String(50), unique=True)
+    name: str = Column(String(50), unique=True)  # The unique constraint is indexed
     date = Column(DateTime, nullable=True)
 
     def __repr__(self):
@@ -98,11 +117,45 @@ class Special(Base):
 
 class Suggestion(Base):
     __tablename__ = "suggestions"
+    __table_args__ = (
+        Index("ix_suggestions_message_id", "message_id", unique=True),
+        Index("ix_suggestions_state", "state"),
+    )
 
-    id: int = Column(BigInteger, primary_key=True, autoincrement=True)
+    id: int = Column(AutoIncrementId, primary_key=True, autoincrement=True)
     author: str = Column(String(50))
     date = Column(DateTime, nullable=True)
     description: str = Column(Text)
+    message_id: int = Column(BigInteger, nullable=True)  # Message of the suggestion
+    channel_id: int = Column(BigInteger, nullable=True)
+    state: str = Column(String(10), nullable=True)  # "open", "accepted" or "refused"
+    signature: bytes = Column(LargeBinary, nullable=True)  # MinHash of the description
 
     def __repr__(self):
         return f"Special(author={self.author}, description={self.description:30.30}"
+
+
+class SuggestionVote(Base):
+    __tablename__ = "suggestion_votes"
+
+    # The primary key also indexes the votes of a suggestion
+    message_id: int = Column(BigInteger, primary_key=True)
+    user_id: int = Column(BigInteger, primary_key=True)
+    emoji: str = Column(String(8), primary_key=True)  # ✅ for or ❌ against
+
+    def __repr__(self):
+        return f"SuggestionVote(message_id={self.message_id}, emoji={self.emoji})"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_name_key", "name", "key", unique=True),)
+
+    id: int = Column(AutoIncrementId, primary_key=True, autoincrement=True)
+    name: str = Column(String(50))  # Name of the handler registered in the scheduler
+    key: str = Column(String(50))  # Identifies the job for its handler, like an id
+    run_at = Column(DateTime)
+    payload: str = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"Job(name={self.name}, key={self.key}, run_at={self.run_at})"
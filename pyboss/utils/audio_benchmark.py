@@ -0,0 +1,74 @@
+"""
+Compares the CPU cost of the audio paths on a local file, Unix only:
+python -m pyboss.utils.audio_benchmark FILE
+"""
+import argparse
+import asyncio
+import resource
+import time
+
+import discord
+
+from pyboss.cogs.utils.audio import FRAME_LENGTH, open_source
+
+
+def _cpu_time() -> float:
+    # ffmpeg is only counted in the children once it has been waited by cleanup
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+async def benchmark(path: str, seconds=30.0, passthrough=False, volume=1.0) -> dict:
+    """
+    Reads seconds of a local audio file like the voice client does, and returns
+    the CPU time spent by the bot and ffmpeg, for one stream
+    """
+    codec = None
+    if passthrough:
+        codec, _ = await discord.FFmpegOpusAudio.probe(path)
+
+    start_cpu, start = _cpu_time(), time.perf_counter()
+    source = open_source(path, codec, volume=volume, passthrough=passthrough)
+    encoder = None if source.is_opus() else discord.opus.Encoder()
+    frames = 0
+    try:
+        while frames * FRAME_LENGTH < seconds and (data := source.read()):
+            if encoder is not None:
+                encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+            frames += 1
+    finally:
+        source.cleanup()
+    cpu, elapsed = _cpu_time() - start_cpu, time.perf_counter() - start
+
+    audio = frames * FRAME_LENGTH
+    return {
+        "mode": "opus passthrough" if source.is_opus() else "pcm",
+        "codec": codec,
+        "audio_seconds": round(audio, 2),
+        "cpu_seconds": round(cpu, 3),
+        "wall_seconds": round(elapsed, 3),
+        "cpu_per_audio_second": round(cpu / audio, 4) if audio else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the CPU cost of the audio paths on a local file"
+    )
+    parser.add_argument("path", help="audio file read by ffmpeg")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--volume", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+    for passthrough in (False, True):
+        result = asyncio.run(
+            benchmark(args.path, args.seconds, passthrough, args.volume)
+        )
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+from sqlalchemy import insert
+
+from pyboss.utils import database
+from pyboss.utils.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    Write-behind buffer which collects rows in memory and inserts them with a
+    single executemany, once batch_size rows are pending or every flush_interval
+    """
+
+    def __init__(
+        self,
+        table,
+        *,
+        batch_size=100,
+        flush_interval=5.0,
+        max_pending=5000,
+        put_timeout=1.0,
+    ):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        # Counters of rows, buffered = flushed + dropped + pending
+        self.buffered = self.flushed = self.dropped = 0
+        self._rows = []
+        # Created lazily to be bound to the loop of the bot
+        self._lock = None
+        self._space = None
+        self._periodic = PeriodicTask(self.flush, flush_interval)
+        self._flushing = None
+        database.register_writer(self)
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "buffered": self.buffered,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "pending": self.pending,
+        }
+
+    def _start(self):
+        if self._periodic.start():
+            self._lock = asyncio.Lock()
+            self._space = asyncio.Condition()
+
+    def _flush_soon(self):
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def _wait_space(self):
+        async with self._space:
+            await self._space.wait_for(lambda: self.pending < self.max_pending)
+
+    async def put(self, row: dict) -> bool:
+        """
+        Adds a row to the buffer. When max_pending rows are waiting, it waits
+        for a flush and drops the row if there is still no space after put_timeout
+        """
+        self._start()
+        if self.pending >= self.max_pending:
+            self._flush_soon()
+            try:
+                await asyncio.wait_for(self._wait_space(), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning(f"The buffer of {self.table.name} is full, row dropped")
+                return False
+
+        self._rows.append(row)
+        self.buffered += 1
+        if self.pending >= self.batch_size:
+            self._flush_soon()
+        return True
+
+    async def flush(self):
+        """
+        Inserts all pending rows in one executemany
+        """
+        if self._lock is None:
+            return  # Nothing was put yet
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            async with self._space:
+                self._space.notify_all()
+            if not rows:
+                return
+
+            try:
+                # A failure of the statement is logged by the database module
+                result = await database.execute(insert(self.table), rows)
+            except Exception:
+                logger.exception(f"Rows of {self.table.name} can't be inserted")
+                result = None
+            if result is None:
+                self.dropped += len(rows)
+            else:
+                self.flushed += len(rows)
+
+    async def close(self):
+        """
+        Stops the periodic flush and writes the remaining rows
+        """
+        self._periodic.cancel()
+        await self.flush()
+        logger.info(f"Buffer of {self.table.name} closed: {self.stats}")
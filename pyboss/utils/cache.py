@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    A mapping which keeps the maxsize most recently used items,
+    each one expires ttl seconds after being stored (never if ttl is None)
+    """
+
+    def __init__(self, maxsize=1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._data = OrderedDict()  # key -> (expiration, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+    def get(self, key: Hashable, default=None, *, count=True) -> Any:
+        try:
+            expiration, value = self._data[key]
+        except KeyError:
+            self.misses += count
+            return default
+        if expiration is not None and expiration < time.monotonic():
+            del self._data[key]
+            self.misses += count
+            return default
+        self._data.move_to_end(key)
+        self.hits += count
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Stores a value, ttl overrides the default one of the cache
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expiration = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (expiration, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default=None) -> Any:
+        try:
+            return self._data.pop(key)[1]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._data.clear()
+
+
+_MISSING = object()
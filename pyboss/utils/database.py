@@ -1,25 +1,168 @@
+import asyncio
 import logging
+import math
 import os
+import time
+from contextlib import asynccontextmanager
 from operator import attrgetter
 
 import sqlalchemy
 import sqlalchemy.exc
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+from pyboss import CONFIG
+from pyboss.utils.metrics import Gauge, Histogram
 
 logger = logging.getLogger(__name__)
 
-if __database_url := os.getenv("DATABASE_URL"):
-    # Raise ImportError is driver is not installed,
-    # other errors are due to an incorrect url syntax
-    engine = sqlalchemy.create_engine(__database_url)
-else:
+# Drivers used by the async engine, the url can keep its sync driver for scripts
+ASYNC_DRIVERS = {
+    "mysql": "aiomysql",
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def to_async_url(url) -> sqlalchemy.engine.URL:
+    """
+    Returns the same database url with the async driver of its backend
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    try:
+        return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    except KeyError:
+        raise ValueError(f"No async driver is known for {url.drivername}") from None
+
+
+def sqlite_url(path: str) -> str:
+    """
+    Returns the url of a SQLite file, or of a memory database shared
+    by the sync and async engines if the path is :memory:
+    """
+    if path == ":memory:":
+        return "sqlite:///file:pyboss?mode=memory&cache=shared&uri=true"
+    return f"sqlite:///{path}"
+
+
+def _is_sqlite_memory(url: sqlalchemy.engine.URL) -> bool:
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def pool_options(url, *, asynchronous=False) -> dict:
+    """
+    Returns the create_engine() arguments of the [database.pool] config section
+    """
+    config = CONFIG["database"]["pool"]
+    options = {"pool_pre_ping": config["pre_ping"]}
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        # The pool ensures a connection is used by one thread at a time
+        options["connect_args"] = {"check_same_thread": False}
+        if _is_sqlite_memory(url):
+            # A single connection, the memory database is lost when it's closed
+            options["poolclass"] = StaticPool
+            return options
+        # SQLite dialects open a connection per query by default, they are kept
+        options["poolclass"] = AsyncAdaptedQueuePool if asynchronous else QueuePool
+
+    options.update(
+        pool_recycle=config["recycle"],
+        pool_size=config["size"],
+        max_overflow=config["max_overflow"],
+        pool_timeout=config["timeout"],
+    )
+    return options
+
+
+def _setup_sqlite_connection(dbapi_connection, _connection_record):
+    config = CONFIG["database"]["sqlite"]
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers work while the single writer commits
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={int(config['mmap_size'])}")
+    cursor.execute(f"PRAGMA cache_size={int(config['cache_size'])}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config['busy_timeout'])}")
+    cursor.close()
+    # Used to compute levels, they are missing from most builds of SQLite
+    dbapi_connection.create_function("sqrt", 1, math.sqrt, deterministic=True)
+    dbapi_connection.create_function("floor", 1, math.floor, deterministic=True)
+
+
+if not (__database_url := os.getenv("DATABASE_URL")):
     # At this point, not url was specified for a remote database, let's create one
+    __database_url = sqlite_url(CONFIG["database"]["sqlite"]["path"])
     logger.warning(
         "You have not specified an DATABASE_URL environment variable, "
-        "a local SQLLite database will be created. "
+        f"the local SQLite database {__database_url} will be used. "
         "Please, restart the script if this is not the desired behavior "
     )
-    engine = sqlalchemy.create_engine("sqlite:///:memory:")
+
+# Raise ImportError is driver is not installed,
+# other errors are due to an incorrect url syntax
+engine = sqlalchemy.create_engine(__database_url, **pool_options(__database_url))
+# Used by the bot, queries are awaited instead of blocking the event loop
+async_engine = create_async_engine(
+    to_async_url(__database_url), **pool_options(__database_url, asynchronous=True)
+)
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _setup_sqlite_connection)
+    event.listen(async_engine.sync_engine, "connect", _setup_sqlite_connection)
+
+# SQLite allows one writer at a time, writes of the bot wait for their turn here
+# instead of failing with "database is locked". Created with the loop of the bot
+_writer_lock = None
+
+
+@asynccontextmanager
+async def _single_writer(write=True):
+    global _writer_lock
+    if not write or async_engine.dialect.name != "sqlite":
+        yield
+        return
+    if _writer_lock is None:
+        _writer_lock = asyncio.Lock()
+    async with _writer_lock:
+        yield
+
+
+def _pool_stats(method: str):
+    def collect():
+        pools = {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+        # Only a QueuePool counts its connections
+        return [
+            ({"engine": name}, getattr(pool, method)())
+            for name, pool in pools.items()
+            if hasattr(pool, method)
+        ]
+
+    return collect
+
+
+POOL_CHECKOUT = Histogram(
+    "database_pool_checkout_seconds",
+    "Time waited to get a connection from the pool, connection included",
+)
+Gauge(
+    "database_pool_checked_out",
+    "Connections currently used",
+    _pool_stats("checkedout"),
+)
+Gauge(
+    "database_pool_overflow",
+    "Connections opened beyond the pool size, negative if the pool is not full",
+    _pool_stats("overflow"),
+)
+Gauge("database_pool_size", "Connections kept by the pool", _pool_stats("size"))
+
+# Objects with pending writes, flushed by close() before the bot leaves
+_writers = []
 
 
 def test_connection():
@@ -27,7 +170,7 @@ def test_connection():
     Tests if the connection to the database.
     """
     try:
-        engine.connect()  # test connection
+        engine.connect().close()  # test connection
     except (
         sqlalchemy.exc.ProgrammingError,
         sqlalchemy.exc.InterfaceError,
@@ -44,25 +187,106 @@ def test_connection():
     return True
 
 
-def execute(stmt):
+def _log_failure(err: sqlalchemy.exc.DBAPIError):
+    # https://docs.sqlalchemy.org/en/14/core/exceptions.html
+    logger.error(
+        f"The following statement execution has failed: {err.statement}"
+        f"\n Full error stack: {err}"
+    )
+
+
+async def _checkout(session: AsyncSession):
+    # The session gets its connection lazily, it's taken here to time the wait
+    start = time.perf_counter()
+    await session.connection()
+    POOL_CHECKOUT.observe(time.perf_counter() - start, engine="async")
+
+
+async def execute(stmt, params=None):
+    """
+    Creates an AsyncSession to execute and commit the given statement.
+    Rows of the result are buffered, so they can be read after the session is closed
+    """
+    async with _single_writer(not getattr(stmt, "is_select", False)):
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            try:
+                await _checkout(session)
+                result = await session.execute(stmt, params)
+                await session.commit()
+            except sqlalchemy.exc.DBAPIError as err:
+                _log_failure(err)
+            else:
+                return result
+    return None
+
+
+async def fetch(stmt) -> list:
+    """
+    Returns the first column of all rows selected by the statement,
+    the models themselves for a statement like select(Model)
+    """
+    result = await execute(stmt)
+    return result.scalars().all() if result is not None else []
+
+
+async def fetch_one(stmt):
+    """
+    Returns the first column of the first row selected, or None if there is no row
+    """
+    result = await execute(stmt)
+    return result.scalars().first() if result is not None else None
+
+
+@asynccontextmanager
+async def transaction():
+    """
+    Yields an AsyncSession inside a transaction,
+    committed at the end of the block or rolled back if an error is raised
+    """
+    async with _single_writer():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            async with session.begin():
+                await _checkout(session)
+                yield session
+
+
+def execute_sync(stmt, params=None):
     """
     Creates a Session to execute the given statement.
+    Blocks the current thread, only meant for scripts and threads outside the bot loop
     """
     with Session(engine) as session:
         try:
-            result = session.execute(stmt)
+            with POOL_CHECKOUT.time(engine="sync"):
+                session.connection()
+            result = session.execute(stmt, params)
+            session.commit()
         except sqlalchemy.exc.DBAPIError as err:
-            # https://docs.sqlalchemy.org/en/13/core/exceptions.html
-            logger.error(
-                f"The following statement execution has failed: {err.statement}"
-                f"\n {err.statement}"
-                f"Full error stack: {err}"
-            )
+            _log_failure(err)
         else:
             return result
     return None
 
 
+def register_writer(writer):
+    """
+    Registers an object with an async close() method which flushes its pending writes
+    """
+    _writers.append(writer)
+
+
+async def close():
+    """
+    Flushes the pending writes then closes all connections of the async engine
+    """
+    for writer in _writers:
+        try:
+            await writer.close()
+        except Exception:
+            logger.exception(f"Pending writes of {writer} have been lost")
+    await async_engine.dispose()
+
+
 def array_to_string(arr, attr=None) -> str:
     """
     Joins values to store the data in MySQL column.
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from pyboss.utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+FANOUT_CALLS = Counter("fanout_calls_total", "Calls made by the fan-outs")
+
+
+class RateLimiter:
+    """
+    Token bucket which lets rate calls per second pass, and up to burst at once
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class FanOutReport:
+    sent: int = 0
+    failures: dict = field(default_factory=dict)  # key of the target -> exception
+    elapsed: float = 0.0  # Seconds
+
+    @property
+    def throughput(self) -> float:
+        """
+        Calls per second, failed ones included
+        """
+        calls = self.sent + len(self.failures)
+        return calls / self.elapsed if self.elapsed else 0.0
+
+
+async def fan_out(
+    targets: Iterable,
+    send: Callable[[Any], Awaitable],
+    *,
+    name="fanout",
+    concurrency=5,
+    limiter: Optional[RateLimiter] = None,
+    key: Callable = None,
+) -> FanOutReport:
+    """
+    Awaits send for each target, with at most concurrency calls at the same time
+    and at the pace of the limiter. A failed call is recorded in the report under
+    key(target) and doesn't stop the other ones
+    """
+    report = FanOutReport()
+    remaining = iter(targets)  # Shared by the workers, each one takes the next
+    start = time.perf_counter()
+
+    async def worker():
+        for target in remaining:
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                await send(target)
+            except Exception as err:
+                report.failures[key(target) if key else target] = err
+                FANOUT_CALLS.inc(name=name, status="failed")
+            else:
+                report.sent += 1
+                FANOUT_CALLS.inc(name=name, status="sent")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    report.elapsed = time.perf_counter() - start
+    if report.failures:
+        first = islice(report.failures.items(), 5)
+        sample = ", ".join(f"{key}: {err}" for key, err in first)
+        logger.warning(f"{name}: {len(report.failures)} calls have failed ({sample})")
+    logger.info(
+        f"{name}: {report.sent} calls sent in {report.elapsed:.2f}s "
+        f"({report.throughput:.1f}/s)"
+    )
+    return report
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from pyboss.models import Member
+from pyboss.utils import database
+from pyboss.utils.ledger import ledger
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """
+    Snapshot of the members ranked by XP, loaded once then updated
+    incrementally when the ledger settles XP. Until it's loaded, the ranks
+    and pages are read in the database with the XP index
+    """
+
+    def __init__(self):
+        # Sorted list of (-XP, -member id), like the backward scan of the index
+        self._entries = None
+        self._xp = {}  # member id -> XP
+        self._names = {}  # member id -> name
+        self._loading = None
+
+    def __len__(self):
+        return len(self._entries or ())
+
+    def _start_loading(self) -> asyncio.Future:
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+            self._loading.add_done_callback(self._on_loaded)
+        return self._loading
+
+    def _on_loaded(self, loading: asyncio.Future):
+        if loading.cancelled():
+            failed = True
+        elif err := loading.exception():
+            logger.error("The leaderboard can't be loaded", exc_info=err)
+            failed = True
+        else:
+            failed = not loading.result()
+        if failed and self._loading is loading:
+            self._loading = None  # A failed load is tried again at the next use
+
+    async def load(self):
+        """
+        Loads the snapshot, or waits for the load in progress
+        """
+        await asyncio.wait({self._start_loading()})
+
+    async def _load(self) -> bool:
+        # All the members are read, they are sorted in Python
+        result = await database.execute(select(Member.id, Member.name, Member.XP))
+        if result is None:
+            return False  # The failure has been logged by the database module
+        rows = result.all()
+        self._xp = {id: xp or 0 for id, _, xp in rows}
+        self._names = {id: name for id, name, _ in rows}
+        self._entries = sorted((-xp, -id) for id, xp in self._xp.items())
+        return True
+
+    def update(self, member_id: int, xp: int, name: str = None):
+        """
+        Moves a member to its new place, in O(log n) plus a memmove of the list
+        """
+        if self._entries is None:
+            return  # Loaded with the up to date values at the first use
+        if (old_xp := self._xp.get(member_id)) is not None:
+            del self._entries[bisect_left(self._entries, (-old_xp, -member_id))]
+        insort(self._entries, (-xp, -member_id))
+        self._xp[member_id] = xp
+        if name is not None:
+            self._names[member_id] = name
+
+    def apply_settlement(self, settled: dict[int, tuple[int, int]]):
+        for member_id, (xp, _) in settled.items():
+            self.update(member_id, xp)
+
+    @staticmethod
+    async def _count_above(xp: int) -> Optional[int]:
+        # A range of the XP index
+        return await database.fetch_one(
+            select(func.count()).select_from(Member).where(Member.XP > xp)
+        )
+
+    async def count(self) -> int:
+        """
+        Returns the number of ranked members
+        """
+        if self._entries is None:
+            self._start_loading()
+            count = await database.fetch_one(select(func.count()).select_from(Member))
+            return count or 0
+        return len(self._entries)
+
+    async def rank(self, member_id: int) -> Optional[int]:
+        """
+        Returns the rank of a member, members with the same XP share their rank
+        """
+        if self._entries is None:
+            self._start_loading()
+            result = await database.execute(
+                select(Member.XP).where(Member.id == member_id)
+            )
+            if result is None or (row := result.first()) is None:
+                return None
+            above = await self._count_above(row.XP or 0)
+            return above + 1 if above is not None else None
+
+        if (xp := self._xp.get(member_id)) is None:
+            return None
+        return bisect_left(self._entries, (-xp,)) + 1
+
+    async def page(self, number: int, size=10) -> list[tuple[int, int, str, int]]:
+        """
+        Returns (rank, member id, name, XP) of the members on this page, from 1
+        """
+        start = (number - 1) * size
+        if self._entries is None:
+            self._start_loading()
+            return await self._read_page(start, size)
+
+        rows = []
+        for neg_xp, neg_id in self._entries[start : start + size]:
+            rank = bisect_left(self._entries, (neg_xp,)) + 1
+            rows.append((rank, -neg_id, self._names.get(-neg_id), -neg_xp))
+        return rows
+
+    async def _read_page(self, start: int, size: int) -> list[tuple]:
+        result = await database.execute(
+            select(Member.id, Member.name, Member.XP)
+            .order_by(Member.XP.desc(), Member.id.desc())
+            .offset(start)
+            .limit(size)
+        )
+        if result is None or not (members := result.all()):
+            return []
+        # Only the rank of the first member is counted, the next ones follow it
+        if (rank := await self._count_above(members[0].XP or 0)) is None:
+            return []
+        rows, previous_xp = [], None
+        for position, (id, name, xp) in enumerate(members, start + 1):
+            xp = xp or 0
+            if xp != previous_xp:
+                rank = position if previous_xp is not None else rank + 1
+            rows.append((rank, id, name, xp))
+            previous_xp = xp
+        return rows
+
+
+leaderboard = Leaderboard()
+ledger.listeners.append(leaderboard.apply_settlement)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, func, select, update
+
+from pyboss import CONFIG
+from pyboss.models import Member
+from pyboss.utils import database
+from pyboss.utils.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+def level_for(xp: int) -> int:
+    """
+    Returns the level reached with this amount of XP
+    """
+    return int(max(xp, 0) ** (1 / 2) / 50) + 1
+
+
+class XPLedger:
+    """
+    Accumulates XP changes of members in memory,
+    then settles all of them in one bulk UPDATE every flush_interval.
+    The level is computed by the database from the new XP, like level_for()
+    """
+
+    def __init__(self, *, flush_interval=60.0):
+        self.flush_interval = flush_interval
+        self._deltas = defaultdict(int)  # member id -> XP not yet written
+        self._settling = {}  # Deltas being written by the current flush
+        # Callbacks called with the new (XP, level) of members after each flush
+        self.listeners = []
+        # Created lazily to be bound to the loop of the bot
+        self._lock = None
+        self._periodic = PeriodicTask(self.flush, flush_interval)
+        database.register_writer(self)
+
+    def _start(self):
+        if self._periodic.start():
+            self._lock = asyncio.Lock()
+
+    def add(self, member_id: int, delta: int):
+        """
+        Adds (or removes if negative) XP to a member, written at the next flush
+        """
+        self._start()
+        self._deltas[member_id] += delta
+
+    def pending(self, member_id: int) -> int:
+        return self._deltas.get(member_id, 0) + self._settling.get(member_id, 0)
+
+    async def flush(self) -> dict[int, tuple[int, int]]:
+        """
+        Writes all pending XP in one transaction and returns the new (XP, level)
+        of the members updated. Unregistered members are ignored
+        """
+        if self._lock is None:
+            return {}  # Nothing was added yet
+        async with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(int)
+            return await self._apply(deltas)
+
+    async def settle(self, deltas: dict[int, int]) -> dict[int, tuple[int, int]]:
+        """
+        Writes these XP changes now, in one transaction with the pending XP
+        of the same members, and returns their new (XP, level).
+        If the transaction fails, the changes are kept for the next flush
+        """
+        self._start()
+        async with self._lock:
+            merged = {
+                member_id: delta + self._deltas.pop(member_id, 0)
+                for member_id, delta in deltas.items()
+            }
+            return await self._apply(merged)
+
+    async def _apply(self, deltas: dict[int, int]) -> dict[int, tuple[int, int]]:
+        if not deltas:
+            return {}
+        self._settling = deltas
+        try:
+            settled = await self._settle(deltas)
+        except Exception:
+            # Not only the statement, the pool can time out or the connection drop
+            logger.exception(f"XP of {len(deltas)} members can't be settled")
+            # Restores the deltas to retry at the next flush
+            for member_id, delta in deltas.items():
+                self._deltas[member_id] += delta
+            return {}
+        finally:
+            self._settling = {}
+
+        for listener in self.listeners:
+            listener(settled)
+        return settled
+
+    @staticmethod
+    async def _settle(deltas: dict[int, int]) -> dict[int, tuple[int, int]]:
+        table = Member.__table__
+        xp = func.coalesce(table.c.XP, 0) + bindparam("delta")
+        new_xp = case((xp < 0, 0), else_=xp)
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("member_id"))
+            # MySQL assigns from left to right with the updated values,
+            # the level is set first to read the previous XP, like other databases
+            .ordered_values(
+                (table.c.level, func.floor(func.sqrt(new_xp) / 50) + 1),
+                (table.c.XP, new_xp),
+            )
+        )
+        async with database.transaction() as session:
+            await session.execute(
+                stmt,
+                [
+                    {"member_id": member_id, "delta": delta}
+                    for member_id, delta in deltas.items()
+                ],
+            )
+            rows = await session.execute(
+                select(Member.id, Member.XP, Member.level).where(Member.id.in_(deltas))
+            )
+            return {member_id: (xp, int(level)) for member_id, xp, level in rows}
+
+    async def close(self):
+        """
+        Stops the periodic settlement and writes the remaining XP
+        """
+        self._periodic.cancel()
+        await self.flush()
+
+
+ledger = XPLedger(**CONFIG["ledger"]["xp"])
@@ -0,0 +1,155 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# All metrics by name, rendered in the Prometheus text format
+REGISTRY = {}
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, **extra) -> str:
+    items = key + tuple(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        REGISTRY[name] = self
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines += [f"{name}{labels} {value}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(_labels_key(labels), 0)
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, _format_labels(key), value
+
+
+class Gauge(Metric):
+    """
+    A value set by the code, or read by callback at each render.
+    The callback returns the value, or a list of (labels dict, value) pairs
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, callback: Callable = None):
+        super().__init__(name, description)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, **labels):
+        self._values[_labels_key(labels)] = value
+
+    def samples(self):
+        values = dict(self._values)
+        if self.callback is not None:
+            collected = self.callback()
+            if isinstance(collected, (int, float)):
+                values[()] = collected
+            else:
+                values.update((_labels_key(labels), v) for labels, v in collected)
+        for key, value in values.items():
+            yield self.name, _format_labels(key), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, description: str, buckets=BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _labels_key(labels)
+        if key not in self._values:
+            self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        counts = self._values[key]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            counts[index] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(key, le=bound), cumulative
+            yield f"{self.name}_bucket", _format_labels(key, le="+Inf"), counts[-1]
+            yield f"{self.name}_sum", _format_labels(key), counts[-2]
+            yield f"{self.name}_count", _format_labels(key), counts[-1]
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY.values()) + "\n"
+
+
+async def _handle_metrics(_request):
+    return web.Response(text=render(), content_type="text/plain")
+
+
+async def serve(host: str, port: int) -> Optional[web.AppRunner]:
+    """
+    Exposes the metrics on http://host:port/metrics
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as err:
+        logger.error(f"Metrics can't be exposed on {host}:{port}: {err}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Metrics are exposed on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,168 @@
+import logging
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+
+from pyboss.models import (
+    Agenda,
+    Base,
+    Job,
+    Member,
+    Message,
+    Planning,
+    Suggestion,
+    SuggestionVote,
+)
+from pyboss.utils import database
+
+logger = logging.getLogger(__name__)
+
+# Kept out of the models metadata, this table describes the schema itself
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(100)),
+    Column("applied_at", DateTime),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, description: str):
+    """
+    Registers a function which upgrades the schema with the given connection,
+    versions are applied in ascending order and only once
+    """
+
+    def decorator(func):
+        MIGRATIONS.append(Migration(version, description, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+
+    return decorator
+
+
+def add_missing_column(connection, model, column_name: str):
+    """
+    Adds a column declared in the model if the table doesn't have it yet
+    """
+    table = model.__table__
+    if column_name in {c["name"] for c in inspect(connection).get_columns(table.name)}:
+        return
+    column = table.c[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(
+        text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+    )
+
+
+def create_missing_indexes(connection, model):
+    """
+    Creates the indexes declared in the model if the table doesn't have them yet
+    """
+    table = model.__table__
+    existing = {i["name"] for i in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(connection)
+
+
+@migration(1, "Create the tables")
+def create_tables(connection):
+    # Only missing tables are created, with the current schema of the models
+    Base.metadata.create_all(connection)
+
+
+@migration(2, "Add members group_role and validate_state, add the indexes")
+def add_member_columns_and_indexes(connection):
+    add_missing_column(connection, Member, "group_role")
+    add_missing_column(connection, Member, "validate_state")
+    for model in (Agenda, Planning, Message, Job):
+        create_missing_indexes(connection, model)
+
+
+@migration(3, "Add the index of members XP for the leaderboard")
+def add_members_xp_index(connection):
+    create_missing_indexes(connection, Member)
+
+
+@migration(4, "Add the suggestions message, channel and state, and their votes")
+def add_suggestion_votes(connection):
+    for column_name in ("message_id", "channel_id", "state"):
+        add_missing_column(connection, Suggestion, column_name)
+    create_missing_indexes(connection, Suggestion)
+    SuggestionVote.__table__.create(connection, checkfirst=True)
+
+
+@migration(5, "Add the suggestions signature")
+def add_suggestion_signature(connection):
+    # Filled when the duplicates index is loaded
+    add_missing_column(connection, Suggestion, "signature")
+
+
+def current_version(connection, *, create=True) -> int:
+    """
+    Returns the version of the schema, 0 if no migration was applied.
+    Without create, the database is only read and a missing table means 0
+    """
+    if create:
+        schema_version.create(connection, checkfirst=True)
+    elif not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def pending_migrations(*, create=True) -> list[Migration]:
+    with database.engine.begin() as connection:
+        version = current_version(connection, create=create)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def upgrade():
+    """
+    Applies the pending migrations, each one in its own transaction
+    """
+    for m in pending_migrations():
+        logger.info(f"Applying migration {m.version}: {m.description}")
+        with database.engine.begin() as connection:
+            m.upgrade(connection)
+            connection.execute(
+                insert(schema_version).values(
+                    version=m.version,
+                    description=m.description,
+                    applied_at=datetime.now(),
+                )
+            )
+
+
+def check() -> int:
+    """
+    Logs the pending migrations, returns 1 if there is any, 0 otherwise
+    """
+    pending = pending_migrations(create=False)  # No DDL when checking
+    for m in pending:
+        logger.warning(f"Pending migration {m.version}: {m.description}")
+    if not pending:
+        logger.info("The database schema is up to date")
+    return int(bool(pending))
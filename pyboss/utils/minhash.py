@@ -0,0 +1,127 @@
+import random
+import re
+import struct
+import unicodedata
+import zlib
+from collections import defaultdict
+from typing import Hashable, Optional
+
+_PRIME = (1 << 31) - 1  # Mersenne prime, the hashes are packed in 4 bytes
+_WORDS = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases a text and removes its accents and punctuation
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_WORDS.findall(text))
+
+
+def shingles(text: str, size=4) -> set[int]:
+    """
+    Returns the hashes of the sequences of size characters of the normalized text
+    """
+    if not (text := normalize(text)):
+        return set()
+    return {
+        zlib.crc32(text[i : i + size].encode())
+        for i in range(max(1, len(text) - size + 1))
+    }
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures, the fraction of equal values in two signatures
+    estimates the Jaccard similarity of the shingles of their texts.
+    The seed fixes the permutations, so signatures can be persisted
+    """
+
+    def __init__(self, permutations=64, shingle_size=4, seed=0):
+        self.permutations = permutations
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._coefficients = [
+            (rng.randrange(1, _PRIME), rng.randrange(_PRIME))
+            for _ in range(permutations)
+        ]
+
+    def signature(self, text: str) -> Optional[tuple[int, ...]]:
+        """
+        Returns the signature of a text, None if it has no word
+        """
+        if not (hashes := shingles(text, self.shingle_size)):
+            return None
+        return tuple(
+            min((a * h + b) % _PRIME for h in hashes) for a, b in self._coefficients
+        )
+
+    def pack(self, signature: tuple[int, ...]) -> bytes:
+        return struct.pack(f"<{len(signature)}I", *signature)
+
+    def unpack(self, data: Optional[bytes]) -> Optional[tuple[int, ...]]:
+        """
+        Returns a packed signature, None if it has been computed with other settings
+        """
+        if not data or len(data) != 4 * self.permutations:
+            return None
+        return struct.unpack(f"<{self.permutations}I", data)
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class LSHIndex:
+    """
+    Locality-sensitive hashing of MinHash signatures: each band of rows of a
+    signature is a key of a bucket, so similar signatures share a bucket.
+    A query only compares the signatures of its buckets, whatever the size
+    of the index
+    """
+
+    def __init__(self, bands=16):
+        self.bands = bands
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._signatures = {}  # key -> signature
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._signatures
+
+    def _band_keys(self, signature: tuple[int, ...]):
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            yield signature[band * rows : (band + 1) * rows]
+
+    def add(self, key: Hashable, signature: tuple[int, ...]):
+        if key in self._signatures:
+            self.remove(key)
+        self._signatures[key] = signature
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets[band_key].add(key)
+
+    def remove(self, key: Hashable):
+        signature = self._signatures.pop(key)
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets[band_key].discard(key)
+            if not buckets[band_key]:
+                del buckets[band_key]
+
+    def query(self, signature: tuple[int, ...], threshold=0.5) -> list[tuple]:
+        """
+        Returns the (key, estimated similarity) of the signatures at least
+        as similar as the threshold, the most similar first
+        """
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(band_key, ()))
+        matches = [
+            (key, score)
+            for key in candidates
+            if (score := similarity(signature, self._signatures[key])) >= threshold
+        ]
+        return sorted(matches, key=lambda match: match[1], reverse=True)
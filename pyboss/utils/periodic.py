@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    Awaits a function every interval in a task created at the first start,
+    to be bound to the loop of the bot. A failed call is logged and the next
+    ones still run
+    """
+
+    def __init__(self, func: Callable[[], Awaitable], interval: float):
+        self.func = func
+        self.interval = interval
+        self._task = None
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> bool:
+        """
+        Starts the task if it's not running yet, returns True if it was started now
+        """
+        if self._task is not None:
+            return False
+        self._task = asyncio.create_task(self._run())
+        return True
+
+    async def _run(self):
+        name = getattr(self.func, "__qualname__", repr(self.func))
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.func()
+            except Exception:
+                logger.exception(f"The periodic call of {name} has failed")
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
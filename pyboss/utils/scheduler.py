@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import delete, insert, select
+
+from pyboss.models import Job
+from pyboss.utils import database
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class ScheduledJob:
+    """
+    An entry of the scheduler heap, ordered by date then by insertion
+    """
+
+    when: float  # Timestamp
+    seq: int
+    callback: Callable[..., Awaitable[Any]] = field(compare=False)
+    args: tuple = field(compare=False, default=())
+    job_id: Optional[int] = field(compare=False, default=None)  # Row in jobs table
+    cancelled: bool = field(compare=False, default=False)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Runs coroutines at a given date from a single asyncio task and a heap.
+    Durable jobs are stored in the jobs table and reloaded at startup,
+    they are run by the handler registered with their name
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._heap = []
+        self._durables = {}  # (name, key) -> ScheduledJob
+        self._counter = itertools.count()
+        # Created at start to be bound to the loop of the bot
+        self._wakeup = None
+        self._task = None
+        self._running = set()  # Jobs executed, the loop only keeps weak references
+
+    def __len__(self):
+        return sum(not job.cancelled for job in self._heap)
+
+    def handler(self, name: str):
+        """
+        Decorator which registers a coroutine function called with
+        the key and the payload of the durable jobs with this name
+        """
+
+        def decorator(func):
+            self._handlers[name] = func
+            return func
+
+        return decorator
+
+    async def start(self):
+        """
+        Loads the durable jobs from the database and starts running them
+        """
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        for job in await database.fetch(select(Job)):
+            self._push_durable(job.id, job.name, job.key, job.run_at, job.payload)
+        logger.info(f"{len(self)} jobs have been loaded in the scheduler")
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _push(self, when: float, callback, *args, job_id=None) -> ScheduledJob:
+        job = ScheduledJob(when, next(self._counter), callback, args, job_id)
+        heapq.heappush(self._heap, job)
+        # Wakes up the loop if this job is the next one to run
+        if self._wakeup is not None and self._heap[0] is job:
+            self._wakeup.set()
+        return job
+
+    def _push_durable(self, job_id, name, key, run_at, payload) -> ScheduledJob:
+        if old_job := self._durables.get((name, key)):
+            old_job.cancel()
+        job = self._push(
+            run_at.timestamp(), self._run_durable, name, key, payload, job_id=job_id
+        )
+        self._durables[name, key] = job
+        return job
+
+    def call_later(self, delay: float, callback, *args) -> ScheduledJob:
+        """
+        Schedules a coroutine function in delay seconds, it's not persisted
+        """
+        return self._push(time.time() + delay, callback, *args)
+
+    def call_at(self, when: float, callback, *args) -> ScheduledJob:
+        """
+        Schedules a coroutine function at the timestamp, it's not persisted
+        """
+        return self._push(when, callback, *args)
+
+    async def schedule(self, name: str, run_at: datetime, key, payload: str = None):
+        """
+        Stores a durable job run at this date by the handler of name.
+        A job with the same name and key replaces the previous one
+        """
+        key = str(key)
+        async with database.transaction() as session:
+            await session.execute(delete(Job).where(Job.name == name, Job.key == key))
+            result = await session.execute(
+                insert(Job).values(name=name, key=key, run_at=run_at, payload=payload)
+            )
+        self._push_durable(result.inserted_primary_key[0], name, key, run_at, payload)
+
+    async def cancel(self, name: str, key):
+        """
+        Cancels and deletes a durable job if it exists
+        """
+        key = str(key)
+        if job := self._durables.pop((name, key), None):
+            job.cancel()
+        await database.execute(delete(Job).where(Job.name == name, Job.key == key))
+
+    def when(self, name: str, key) -> Optional[datetime]:
+        """
+        Returns the date of a pending durable job, without querying the database
+        """
+        job = self._durables.get((name, str(key)))
+        if job is None or job.cancelled:
+            return None
+        return datetime.fromtimestamp(job.when)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+
+            timeout = None
+            if self._heap:
+                timeout = self._heap[0].when - time.time()
+                if timeout <= 0:
+                    job = heapq.heappop(self._heap)
+                    task = asyncio.create_task(self._execute(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+                    continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    async def _execute(job: ScheduledJob):
+        try:
+            await job.callback(*job.args)
+        except Exception:
+            logger.exception(f"The scheduled job {job} has failed")
+
+    async def _run_durable(self, name, key, payload):
+        job = self._durables.pop((name, key))
+        try:
+            handler = self._handlers[name]
+        except KeyError:
+            logger.error(f"No handler is registered for the jobs {name}")
+            return
+        await handler(key, payload)
+        # Kept in database if the handler has failed, to be retried at restart
+        await database.execute(delete(Job).where(Job.id == job.job_id))
+
+
+scheduler = Scheduler()